@@ -0,0 +1,181 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#  Filename : fill_occlusions.py
+#  Purpose  : Measures the cost of traverse() of the occlusion-filling
+#             chaining iterators as a function of the length of the chain
+#
+#  Chaining needs a view map, so this script is a style module: use it in
+#  a line set in Python Scripting mode and render a frame, e.g. of a scene
+#  with long, often occluded silhouettes.  With LEGACY = True, the chaining
+#  is done by the iterator as it used to be, which walks every gap edge by
+#  edge on every traverse() call, for comparison.
+
+from collections import defaultdict
+from time import perf_counter
+
+from freestyle.chainingiterators import (
+    NATURES,
+    pyChainSilhouetteGenericIterator,
+    pyFillOcclusionsAbsoluteChainingIterator,
+    )
+from freestyle.predicates import (
+    QuantitativeInvisibilityUP1D,
+    TrueUP1D,
+    )
+from freestyle.shaders import (
+    ConstantColorShader,
+    ConstantThicknessShader,
+    )
+from freestyle.types import (
+    AdjacencyIterator,
+    ChainingIterator,
+    Operators,
+    TVertex,
+    )
+from freestyle.utils import ContextFunctions as CF
+from freestyle.utils import find_matching_vertex
+
+
+LEGACY = False
+
+# width of the buckets of chains, by (approximate) number of ViewEdges
+BUCKET = 16
+
+
+class LegacyFillOcclusionsAbsoluteChainingIterator(ChainingIterator):
+    """pyFillOcclusionsAbsoluteChainingIterator as it was before gap lengths were cached """
+    def __init__(self, length):
+        ChainingIterator.__init__(self, False, True, None, True)
+        self._length = float(length)
+        self.timestamp = CF.get_time_stamp()
+
+    def init(self):
+        pass
+
+    def traverse(self, iter):
+        winner = None
+        winnerOrientation = False
+        it = AdjacencyIterator(iter)
+        ## case of TVertex
+        vertex = self.next_vertex
+        if type(vertex) is TVertex:
+            mate = vertex.get_mate(self.current_edge)
+            winner = find_matching_vertex(mate.id, it)
+            winnerOrientation = not it.is_incoming if not it.is_end else False
+        ## case of NonTVertex
+        else:
+            for nat in NATURES:
+                if (self.current_edge.nature & nat):
+                    for ve in it:
+                        if (ve.nature & nat):
+                            if winner is not None:
+                                return None
+                            winner = ve
+                            winnerOrientation = not it.is_incoming
+                    break
+
+        if winner is not None and winner.time_stamp != self.timestamp:
+            connexl = 0.0
+            _cit = pyChainSilhouetteGenericIterator(False, False)
+            _cit.begin = winner
+            _cit.current_edge = winner
+            _cit.orientation = winnerOrientation
+            _cit.init()
+
+            while (not _cit.is_end) and _cit.object.time_stamp != self.timestamp:
+                connexl += _cit.object.length_2d
+                _cit.increment()
+                if _cit.is_begin:
+                    break
+
+            if connexl > self._length:
+                return None
+
+        return winner
+
+
+class Timed:
+    """
+    Records the duration of every traverse() call, grouped by the number
+    of ViewEdges of the chain it belongs to.  Every chain starts with a
+    call to init().
+    """
+    def start_timing(self):
+        # bucket -> durations of the traverse() calls of the chains in it
+        self.timings = defaultdict(list)
+        self._chain = []
+
+    def end_chain(self):
+        if self._chain:
+            # a chain of n ViewEdges takes about n traverse() calls
+            self.timings[len(self._chain) // BUCKET].extend(self._chain)
+            self._chain = []
+
+    def init(self):
+        self.end_chain()
+        self._base.init(self)
+
+    def traverse(self, iter):
+        start = perf_counter()
+        winner = self._base.traverse(self, iter)
+        self._chain.append(perf_counter() - start)
+        return winner
+
+
+class TimedFillOcclusionsChainingIterator(Timed, pyFillOcclusionsAbsoluteChainingIterator):
+    _base = pyFillOcclusionsAbsoluteChainingIterator
+
+    def __init__(self, length):
+        pyFillOcclusionsAbsoluteChainingIterator.__init__(self, length)
+        self.start_timing()
+
+
+class TimedLegacyFillOcclusionsChainingIterator(Timed, LegacyFillOcclusionsAbsoluteChainingIterator):
+    _base = LegacyFillOcclusionsAbsoluteChainingIterator
+
+    def __init__(self, length):
+        LegacyFillOcclusionsAbsoluteChainingIterator.__init__(self, length)
+        self.start_timing()
+
+
+def report(iterator):
+    iterator.end_chain()
+    timings = iterator.timings
+    print("fill occlusions ({}): mean traverse() time by chain length".format(
+          "legacy" if LEGACY else "cached"))
+    for bucket in sorted(timings):
+        times = timings[bucket]
+        print("  {:5d}-{:<5d} ViewEdges {:10.2f} us  ({} calls)".format(
+              bucket * BUCKET + 1, (bucket + 1) * BUCKET, sum(times) / len(times) * 1e6, len(times)))
+
+
+# as in styles/ignore_small_occlusions.py, the iterator is constructed after
+# the selection, so that it picks up the time stamp of the selection
+Operators.select(QuantitativeInvisibilityUP1D(0))
+if LEGACY:
+    iterator = TimedLegacyFillOcclusionsChainingIterator(12)
+else:
+    iterator = TimedFillOcclusionsChainingIterator(12)
+Operators.bidirectional_chain(iterator)
+report(iterator)
+shaders_list = [
+    ConstantThicknessShader(3),
+    ConstantColorShader(0.0, 0.0, 0.0),
+    ]
+Operators.create(TrueUP1D(), shaders_list)
@@ -0,0 +1,66 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+#  Filename : import_time.py
+#  Purpose  : Measures the cost of importing the freestyle package
+#
+#  The freestyle package depends on modules that are built into Blender,
+#  so this script has to be run by Blender itself:
+#
+#      blender --background --python benchmarks/import_time.py
+
+import os
+import sys
+from time import perf_counter
+
+# make sure the modules of this checkout are used, not the bundled ones
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "modules"))
+
+# statements as they appear in the style modules and the parameter editor
+SCENARIOS = (
+    "import freestyle",
+    "from freestyle.types import Operators",
+    "from freestyle.types import Operators\n"
+    "from freestyle.shaders import ConstantColorShader, ConstantThicknessShader",
+    "from freestyle.chainingiterators import ChainSilhouetteIterator",
+    "from freestyle import chainingiterators, functions, predicates, shaders, types, utils",
+    "import parameter_editor",
+    )
+
+
+def unload():
+    """Removes the freestyle package from the module cache """
+    for name in tuple(sys.modules):
+        if name in {"freestyle", "parameter_editor"} or name.startswith("freestyle."):
+            del sys.modules[name]
+
+
+def measure(statement, repeat=25):
+    """Returns the best time (in seconds) of importing from scratch """
+    best = float("inf")
+    for _ in range(repeat):
+        unload()
+        start = perf_counter()
+        exec(statement, {})
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    for statement in SCENARIOS:
+        print("{:8.3f} ms  {}".format(measure(statement) * 1000.0, statement.replace("\n", "; ")))
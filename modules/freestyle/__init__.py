@@ -20,5 +20,39 @@
 Top-level module containing all Freestyle stylization constructs
 """
 
-# module members
-from . import chainingiterators, functions, predicates, shaders, types, utils
+# module members; these are imported on first access, so that style modules
+# only pay for the submodules they actually use
+__all__ = (
+    "chainingiterators",
+    "functions",
+    "predicates",
+    "shaders",
+    "types",
+    "utils",
+    )
+
+import sys
+from importlib import import_module
+from types import ModuleType
+
+
+class LazyPackage(ModuleType):
+    """
+    The freestyle package, importing its submodules on first access.
+    (A module-level __getattr__ would need Python 3.7.)
+    """
+    def __getattr__(self, name):
+        if name in __all__:
+            # importing a submodule also sets it as an attribute of the package
+            return import_module("." + name, __name__)
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(__all__))
+
+
+_package = LazyPackage(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+for _name in ("sys", "import_module", "ModuleType", "LazyPackage", "_package", "_name"):
+    _package.__dict__.pop(_name, None)
+sys.modules[__name__] = _package
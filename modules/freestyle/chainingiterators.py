@@ -29,6 +29,7 @@ __all__ = (
     "pyExternalContourChainingIterator",
     "pySketchyChainSilhouetteIterator",
     "pySketchyChainingIterator",
+    "pyFillOcclusionsChainingIterator",
     "pyFillOcclusionsRelativeChainingIterator",
     "pyFillOcclusionsAbsoluteChainingIterator",
     "pyFillOcclusionsAbsoluteAndRelativeChainingIterator",
@@ -43,9 +44,12 @@ from _freestyle import (
     ChainSilhouetteIterator,
     )
 
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
 # constructs for predicate definition in Python
 from freestyle.types import (
-    AdjacencyIterator,
     ChainingIterator,
     Nature,
     TVertex,
@@ -55,12 +59,14 @@ from freestyle.predicates import (
     )
 from freestyle.utils import (
     ContextFunctions as CF,
-    get_chain_length,
-    find_matching_vertex,
+    FrameCache,
+    count_ambiguous_winner,
+    debug_enabled,
+    get_adjacency_index,
+    get_gap_length,
+    id_key,
     )
 
-import bpy
-
 
 NATURES = (
     Nature.SILHOUETTE,
@@ -73,10 +79,194 @@ NATURES = (
     Nature.RIDGE
     )
 
+# bitmask of all natures in NATURES
+NATURE_MASK = reduce(or_, NATURES)
+
+# maps a nature bitmask (masked by NATURE_MASK) to the index in NATURES
+# of its highest-priority nature, or len(NATURES) if it has none of them
+NATURE_PRIORITY = tuple(next((i for i, nat in enumerate(NATURES) if nature & nat), len(NATURES))
+                        for nature in range(NATURE_MASK + 1))
+
 
 def nature_in_preceding(nature, index):
     """ Returns True if given nature appears before index, else False """
-    return any(nature & nat for nat in NATURES[:index])
+    return NATURE_PRIORITY[nature & NATURE_MASK] < index
+
+
+def natural_winner(nature, edges, current_id=None):
+    """
+    Selects the edge that continues a natural chain at a non-T vertex.
+
+    Only the highest-priority nature of the current edge is followed.
+    The scan stops at the first candidate that also has a nature of
+    higher priority, and more than one candidate means there is no
+    winner.
+
+    :arg nature: The nature of the current edge.
+    :type nature: :class:`Nature`
+    :arg edges: The adjacency entries of the vertex, as returned by
+        AdjacencyIndex.adjacent_edges().
+    :type edges: tuple
+    :arg current_id: If given, the entry with this id (see id_key()) is skipped.
+    :type current_id: tuple
+    :return: The adjacency entry of the winner, or None.
+    :rtype: tuple
+    """
+    index = NATURE_PRIORITY[nature & NATURE_MASK]
+    if index == len(NATURES):
+        return None
+    nat = NATURES[index]
+    winner = None
+    for entry in edges:
+        ve_nat = entry[1]
+        if (ve_nat & nat) and entry[3] != current_id:
+            # a match in a preceding nature ends the search
+            if NATURE_PRIORITY[ve_nat & NATURE_MASK] < index:
+                break
+            # a second match must be an error
+            if winner is not None:
+                count_ambiguous_winner()
+                return None
+            winner = entry
+    return winner
+
+
+# A natural chain: the (ViewEdge, orientation) pairs in chaining order,
+# the total 2d length, (visible, length) pairs for the maximal runs of
+# visible (qi == 0) and hidden ViewEdges, and whether the chain is a loop
+Chain = namedtuple("Chain", ["edges", "length", "runs", "closed"])
+
+
+def visibility_runs(edges):
+    """Returns (visible, length) pairs for the runs of visible and hidden ViewEdges in edges """
+    runs = []
+    for ve, orientation in edges:
+        visible = (ve.qi == 0)
+        if runs and runs[-1][0] == visible:
+            runs[-1][1] += ve.length_2d
+        else:
+            runs.append([visible, ve.length_2d])
+    return tuple(map(tuple, runs))
+
+
+class ChainGraph(FrameCache):
+    """
+    The graph that natural chaining (see pyChainSilhouetteGenericIterator
+    without restrictions) follows through the view map. Every ViewEdge,
+    traversed in either orientation, is labelled (when it is first asked
+    for) with the Chain that chaining from it produces and its position
+    in that chain.
+
+    Natural succession is not symmetric (natural_winner gives up on
+    ambiguity and stops at higher priority natures), so a chain is only
+    shared by all of its ViewEdges when succession along it is mutual;
+    otherwise every start is labelled with its own walk.
+
+    Maps (id, orientation) to (Chain, position), where id is the ViewEdge
+    id as returned by id_key().
+    """
+    def __init__(self):
+        FrameCache.__init__(self)
+        # (id, orientation) -> the (ViewEdge, orientation) that follows, or None
+        self._successors = {}
+
+    def clear(self):
+        FrameCache.clear(self)
+        self._successors.clear()
+
+    def successor(self, ve, orientation):
+        """Returns the (ViewEdge, orientation) pair that follows the given one, or None """
+        key = (id_key(ve.id), orientation)
+        if key in self._successors:
+            return self._successors[key]
+        vertex = ve.last_viewvertex if orientation else ve.first_viewvertex
+        adjacency = get_adjacency_index()
+        if type(vertex) is TVertex:
+            entry = adjacency.mate_of(vertex, ve)
+        else:
+            entry = natural_winner(ve.nature, adjacency.edges_of(vertex), key[0])
+        result = self._successors[key] = (entry[0], not entry[2]) if entry is not None else None
+        return result
+
+    def follows(self, node, next_node):
+        """Returns True if next_node is the successor of node """
+        succ = self.successor(*node)
+        return (succ is not None and succ[1] == next_node[1] and
+                id_key(succ[0].id) == id_key(next_node[0].id))
+
+    def mutual(self, node, next_node):
+        """Returns True if next_node follows node, and node follows next_node in the opposite direction """
+        return (self.follows(node, next_node) and
+                self.follows((next_node[0], not next_node[1]), (node[0], not node[1])))
+
+    def walk(self, ve, orientation, visited):
+        """
+        Returns the (ViewEdge, orientation) pairs that follow the given one,
+        up to the end of the chain or the first ViewEdge in visited, and the
+        id of that ViewEdge (None at the end of the chain)
+        """
+        nodes = []
+        node = self.successor(ve, orientation)
+        while node is not None:
+            key = id_key(node[0].id)
+            if key in visited:
+                return nodes, key
+            visited.add(key)
+            nodes.append(node)
+            node = self.successor(*node)
+        return nodes, None
+
+    def label(self, ve, orientation):
+        """
+        Labels the given ViewEdge with its chain, and so every ViewEdge on
+        that chain (in both orientations) if chaining from any of them
+        gives the same chain
+        """
+        start = id_key(ve.id)
+        visited = {start}
+        ahead, stop = self.walk(ve, orientation, visited)
+        # the chain is a loop if it leads back to where it started
+        closed = (stop == start)
+        behind = [] if closed else self.walk(ve, not orientation, visited)[0]
+        edges = tuple((e, not o) for (e, o) in reversed(behind)) + ((ve, orientation),) + tuple(ahead)
+        length = sum(e.length_2d for (e, o) in edges)
+        chain = Chain(edges, length, visibility_runs(edges), closed)
+        reverse = Chain(tuple((e, not o) for (e, o) in reversed(edges)), length,
+                        tuple(reversed(chain.runs)), closed)
+        n = len(edges)
+        # the chain is the same from every ViewEdge on it if all links are
+        # mutual, and it either ends where succession ends on both sides or
+        # closes on itself through a mutual link as well
+        links = list(zip(edges, edges[1:]))
+        if closed:
+            links.append((edges[-1], edges[0]))
+        shared = all(self.mutual(a, b) for a, b in links) and (closed or (
+            self.successor(*edges[-1]) is None and self.successor(edges[0][0], not edges[0][1]) is None))
+        if not shared:
+            self[(start, orientation)] = (chain, len(behind))
+            return
+        for i, (e, o) in enumerate(edges):
+            key = id_key(e.id)
+            self[(key, o)] = (chain, i)
+            self[(key, not o)] = (reverse, n - 1 - i)
+
+    def chain_of(self, ve, orientation):
+        """Returns the (Chain, position) of a ViewEdge traversed in the given orientation """
+        key = (id_key(ve.id), orientation)
+        if key not in self:
+            self.label(ve, orientation)
+        return self[key]
+
+
+_chain_graph = ChainGraph()
+
+
+def get_chain_graph():
+    """
+    Returns the ChainGraph of the view map that is currently processed.
+    Chains are labelled on demand, as chain_of() asks for them.
+    """
+    return _chain_graph.current()
 
 
 class pyChainSilhouetteIterator(ChainingIterator):
@@ -89,33 +279,21 @@ class pyChainSilhouetteIterator(ChainingIterator):
     """
     def __init__(self, stayInSelection=True):
         ChainingIterator.__init__(self, stayInSelection, True, None, True)
+        self._restrictions = (stayInSelection, True)
 
     def init(self):
-        pass
+        self._adjacency = get_adjacency_index()
 
     def traverse(self, iter):
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
         vertex = self.next_vertex
+        ## case of TVertex
         if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            return find_matching_vertex(mate.id, it)
+            entry = self._adjacency.mate_of(vertex, self.current_edge, *self._restrictions)
+            return entry[0] if entry is not None else None
         ## case of NonTVertex
-        winner = None
-        for i, nat in enumerate(NATURES):
-            if (nat & self.current_edge.nature):
-                for ve in it:
-                    ve_nat = ve.nature
-                    if (ve_nat & nat):
-                        # search for matches in previous natures. if match -> break
-                        if nat != ve_nat and nature_in_preceding(ve_nat, index=i):
-                            break
-                        # a second match must be an error
-                        if winner is not None:
-                            return None
-                        # assign winner
-                        winner = ve
-                return winner
+        edges = self._adjacency.adjacent_edges(vertex, *self._restrictions)
+        winner = natural_winner(self.current_edge.nature, edges)
+        return winner[0] if winner is not None else None
 
 
 class pyChainSilhouetteGenericIterator(ChainingIterator):
@@ -133,35 +311,21 @@ class pyChainSilhouetteGenericIterator(ChainingIterator):
 
     def __init__(self, stayInSelection=True, stayInUnvisited=True):
         ChainingIterator.__init__(self, stayInSelection, stayInUnvisited, None, True)
+        self._restrictions = (stayInSelection, stayInUnvisited)
 
     def init(self):
-        pass
+        self._adjacency = get_adjacency_index()
 
     def traverse(self, iter):
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
         vertex = self.next_vertex
+        ## case of TVertex
         if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            return find_matching_vertex(mate.id, it)
+            entry = self._adjacency.mate_of(vertex, self.current_edge, *self._restrictions)
+            return entry[0] if entry is not None else None
         ## case of NonTVertex
-        winner = None
-        for i, nat in enumerate(NATURES):
-            if (nat & self.current_edge.nature):
-                for ve in it:
-                    ve_nat = ve.nature
-                    if ve.id == self.current_edge.id:
-                        continue
-                    if (ve_nat & nat):
-                        if nat != ve_nat and nature_in_preceding(ve_nat, index=i):
-                            break
-
-                        if winner is not None:
-                            return None
-
-                        winner = ve
-                return winner
-        return None
+        edges = self._adjacency.adjacent_edges(vertex, *self._restrictions)
+        winner = natural_winner(self.current_edge.nature, edges, id_key(self.current_edge.id))
+        return winner[0] if winner is not None else None
 
 
 class pyExternalContourChainingIterator(ChainingIterator):
@@ -170,18 +334,39 @@ class pyExternalContourChainingIterator(ChainingIterator):
     def __init__(self):
         ChainingIterator.__init__(self, False, True, None, True)
         self.ExternalContour = ExternalContourUP1D()
+        # ViewEdge id -> result of self.ExternalContour
+        self._verdicts = FrameCache()
+        # (ViewEdge id, orientation) -> adjacency entries of the external
+        # contours at the vertex checked by checkViewEdge
+        self._contours = FrameCache()
 
     def init(self):
         self._nEdges = 0
+        self._adjacency = get_adjacency_index()
+        self._verdicts.check()
+        self._contours.check()
 
-    def checkViewEdge(self, ve, orientation):
-        vertex = (ve.first_viewvertex if orientation else
-                  ve.last_viewvertex)
+    def is_external_contour(self, ve, ve_id):
+        verdict = self._verdicts.get(ve_id)
+        if verdict is None:
+            verdict = self._verdicts[ve_id] = bool(self.ExternalContour(ve))
+        return verdict
 
-        it = AdjacencyIterator(vertex, True, True)
-        result = any(self.ExternalContour(ave) for ave in it)
+    def checkViewEdge(self, ve, orientation):
+        key = (id_key(ve.id), orientation)
+        contours = self._contours.get(key)
+        if contours is None:
+            vertex = (ve.first_viewvertex if orientation else
+                      ve.last_viewvertex)
+            contours = self._contours[key] = tuple(
+                entry for entry in self._adjacency.edges_of(vertex) if self.is_external_contour(entry[0], entry[3]))
+
+        # the selection and unvisited restrictions change while chaining
+        time_stamp = CF.get_time_stamp()
+        result = any(ave.time_stamp == time_stamp and ave.chaining_time_stamp <= time_stamp
+                     for (ave, nature, incoming, ave_id) in contours)
         # report if there is no result (that's bad)
-        if not result and bpy.app.debug_freestyle:
+        if not result and debug_enabled():
             print("pyExternalContourChainingIterator : didn't find next edge")
 
         return result
@@ -190,17 +375,16 @@ class pyExternalContourChainingIterator(ChainingIterator):
         winner = None
         self._nEdges += 1
 
-        it = AdjacencyIterator(iter)
+        edges = self._adjacency.adjacent_edges(self.next_vertex, False, True)
         time_stamp = CF.get_time_stamp()
 
-        for ve in it:
-            if self.ExternalContour(ve) and ve.time_stamp == time_stamp:
+        for ve, nature, incoming, ve_id in edges:
+            if ve.time_stamp == time_stamp and self.is_external_contour(ve, ve_id):
                 winner = ve
 
         if winner is None:
-            it = AdjacencyIterator(iter)
-            for ve in it:
-                if self.checkViewEdge(ve, not it.is_incoming):
+            for ve, nature, incoming, ve_id in edges:
+                if self.checkViewEdge(ve, not incoming):
                     winner = ve
 
         return winner
@@ -210,6 +394,8 @@ class pySketchyChainSilhouetteIterator(ChainingIterator):
     """Natural chaining iterator with a sketchy multiple touch
 
     Chains the same ViewEdge multiple times to achieve a sketchy effect.
+    Every round follows the same path, so the winners found in the first
+    round are recorded and replayed in the next ones.
 
     :arg rounds: Number of times every Viewedge is chained.
     :type rounds: int
@@ -221,9 +407,14 @@ class pySketchyChainSilhouetteIterator(ChainingIterator):
         ChainingIterator.__init__(self, stayInSelection, False, None, True)
         self._timeStamp = CF.get_time_stamp() + nRounds
         self._nRounds = nRounds
+        self._restrictions = (stayInSelection, False)
+        # (time stamp, current edge id, vertex id) -> winner before make_sketchy
+        self._winners = FrameCache()
 
     def init(self):
         self._timeStamp = CF.get_time_stamp() + self._nRounds
+        self._adjacency = get_adjacency_index()
+        self._winners.check()
 
     # keeping this local saves passing a reference to 'self' around
     def make_sketchy(self, ve):
@@ -238,29 +429,18 @@ class pySketchyChainSilhouetteIterator(ChainingIterator):
         return ve
 
     def traverse(self, iter):
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
         vertex = self.next_vertex
+        key = (CF.get_time_stamp(), id_key(self.current_edge.id), id_key(vertex.id))
+        if key in self._winners:
+            return self.make_sketchy(self._winners[key])
+        ## case of TVertex
         if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            return self.make_sketchy(find_matching_vertex(mate.id, it))
+            winner = self._adjacency.mate_of(vertex, self.current_edge, *self._restrictions)
         ## case of NonTVertex
-        winner = None
-        for i, nat in enumerate(NATURES):
-            if (nat & self.current_edge.nature):
-                for ve in it:
-                    if ve.id == self.current_edge.id:
-                        continue
-                    ve_nat = ve.nature
-                    if (ve_nat & nat):
-                        if nat != ve_nat and nature_in_preceding(ve_nat, i):
-                            break
-
-                        if winner is not None:
-                            return self.make_sketchy(None)
-
-                        winner = ve
-                break
+        else:
+            edges = self._adjacency.adjacent_edges(vertex, *self._restrictions)
+            winner = natural_winner(self.current_edge.nature, edges, key[1])
+        winner = self._winners[key] = winner[0] if winner is not None else None
         return self.make_sketchy(winner)
 
 
@@ -268,23 +448,46 @@ class pySketchyChainingIterator(ChainingIterator):
     """Chaining iterator designed for sketchy style
 
     It chaines the same ViewEdge several times in order to produce
-    multiple strokes per ViewEdge.
+    multiple strokes per ViewEdge.  Every round follows the same path,
+    so the winners found in the first round are recorded and replayed
+    in the next ones.
     """
     def __init__(self, nRounds=3, stayInSelection=True):
         ChainingIterator.__init__(self, stayInSelection, False, None, True)
         self._timeStamp = CF.get_time_stamp() + nRounds
         self._nRounds = nRounds
         self.t = False
+        self._restrictions = (stayInSelection, False)
+        # (time stamp, current edge id, vertex id) -> (found, winner)
+        self._winners = FrameCache()
 
     def init(self):
         self._timeStamp = CF.get_time_stamp() + self._nRounds
+        self._adjacency = get_adjacency_index()
+        self._winners.check()
 
     def traverse(self, iter):
+        current_id = id_key(self.current_edge.id)
+        key = (CF.get_time_stamp(), current_id, id_key(self.next_vertex.id))
+        if key not in self._winners:
+            self._winners[key] = self.find_winner(current_id)
+        found, winner = self._winners[key]
+        if not found:
+            return None
+
+        if winner is None:
+            winner = self.current_edge
+        if winner.chaining_time_stamp == self._timeStamp:
+            return None
+        return winner
+
+    def find_winner(self, current_id):
+        """Returns whether the current edge is adjacent to the next vertex, and the last other edge """
         winner = None
         found = False
 
-        for ve in AdjacencyIterator(iter):
-            if self.current_edge.id == ve.id:
+        for ve, nature, incoming, ve_id in self._adjacency.adjacent_edges(self.next_vertex, *self._restrictions):
+            if current_id == ve_id:
                 found = True
                 continue
             winner = ve
@@ -292,143 +495,119 @@ class pySketchyChainingIterator(ChainingIterator):
         if not found:
             # This is a fatal error condition: self.current_edge must be found
             # among the edges seen by the AdjacencyIterator [bug #35695].
-            if bpy.app.debug_freestyle:
+            if debug_enabled():
                 print('pySketchyChainingIterator: current edge not found')
-            return None
-
-        if winner is None:
-            winner = self.current_edge
-        if winner.chaining_time_stamp == self._timeStamp:
-            return None
-        return winner
+        return (found, winner)
 
 
-class pyFillOcclusionsRelativeChainingIterator(ChainingIterator):
+class pyFillOcclusionsChainingIterator(ChainingIterator):
     """Chaining iterator that fills small occlusions
 
-    :arg percent: The maximul length of the occluded part, expressed
-        in a percentage of the total chain length.
+    A hidden part of the chain is bridged if its length stays within the
+    given limits.  Gap lengths and chain lengths are looked up in tables
+    that are built once per frame (see utils.get_gap_length() and
+    ChainGraph), so the cost of traverse() does not grow with the length
+    of the chains.
+
+    :arg percent: The maximum length of the occluded part, expressed
+        in a percentage of the total chain length, or None.
     :type percent: float
+    :arg length: The maximum length of the occluded part in pixels, or None.
+    :type length: float
+    :arg qi: If True, ViewEdges with a quantitative invisibility of 0 are
+        visible; otherwise the ViewEdges in the selection are.
+    :type qi: bool
+    :arg time_stamp: The time stamp of the selection, or None to use the
+        time stamp at which the chaining takes place.
+    :type time_stamp: int
     """
-
-    def __init__(self, percent):
+    def __init__(self, percent=None, length=None, qi=False, time_stamp=None):
         ChainingIterator.__init__(self, False, True, None, True)
         self._length = 0.0
-        self._percent = float(percent)
-        self.timestamp = CF.get_time_stamp()
+        self._percent = None if percent is None else float(percent)
+        self._absLength = None if length is None else float(length)
+        self._qi = qi
+        self.timestamp = time_stamp
 
     def init(self):
         # A chain's length should preferably be evaluated only once.
         # Therefore, the chain length is reset here.
         self._length = 0.0
+        self._adjacency = get_adjacency_index()
+        # chain lengths are only needed for a relative limit
+        self._chain_graph = get_chain_graph() if self._percent is not None else None
+
+    def criterion(self):
+        """Returns the visibility criterion, as passed to utils.get_gap_length() """
+        if self._qi:
+            return ('qi',)
+        return ('time_stamp', CF.get_time_stamp() if self.timestamp is None else self.timestamp)
 
     def traverse(self, iter):
         winner = None
         winnerOrientation = False
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
         vertex = self.next_vertex
+        ## case of TVertex
         if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            winner = find_matching_vertex(mate.id, it)
-            winnerOrientation = not it.is_incoming if not it.is_end else False
+            entry = self._adjacency.mate_of(vertex, self.current_edge, False, True)
+            if entry is not None:
+                winner = entry[0]
+                winnerOrientation = not entry[2]
         ## case of NonTVertex
         else:
+            edges = self._adjacency.adjacent_edges(vertex, False, True)
             for nat in NATURES:
                 if (self.current_edge.nature & nat):
-                    for ve in it:
-                        if (ve.nature & nat):
+                    for ve, ve_nat, incoming, ve_id in edges:
+                        if (ve_nat & nat):
                             if winner is not None:
+                                count_ambiguous_winner()
                                 return None
                             winner = ve
-                            winnerOrientation = not it.is_incoming
+                            winnerOrientation = not incoming
                     break
 
-        # check timestamp to see if this edge was part of the selection
-        if winner is not None and winner.time_stamp != self.timestamp:
-            # if the edge wasn't part of the selection, let's see
-            # whether it's short enough (with respect to self.percent)
-            # to be included.
-            if self._length == 0.0:
-                self._length = get_chain_length(winner, winnerOrientation)
-
-            # check if the gap can be bridged
-            connexl = 0.0
-            _cit = pyChainSilhouetteGenericIterator(False, False)
-            _cit.begin = winner
-            _cit.current_edge = winner
-            _cit.orientation = winnerOrientation
-            _cit.init()
-
-            while (not _cit.is_end) and _cit.object.time_stamp != self.timestamp:
-                connexl += _cit.object.length_2d
-                _cit.increment()
-                if _cit.is_begin:
-                    break
+        if winner is None:
+            return None
+        criterion = self.criterion()
+        if (winner.qi == 0) if self._qi else (winner.time_stamp == criterion[1]):
+            return winner
 
+        # the winner is hidden; check if the gap can be bridged
+        connexl = get_gap_length(winner, winnerOrientation, criterion)
+        if self._percent is not None:
+            if self._length == 0.0:
+                self._length = self._chain_graph.chain_of(winner, winnerOrientation)[0].length
             if connexl > self._percent * self._length:
                 return None
-
+        if self._absLength is not None and connexl > self._absLength:
+            return None
         return winner
 
 
-class pyFillOcclusionsAbsoluteChainingIterator(ChainingIterator):
+class pyFillOcclusionsRelativeChainingIterator(pyFillOcclusionsChainingIterator):
     """Chaining iterator that fills small occlusions
 
-    :arg size: The maximum length of the occluded part in pixels.
-    :type size: int
+    :arg percent: The maximul length of the occluded part, expressed
+        in a percentage of the total chain length.
+    :type percent: float
     """
-    def __init__(self, length):
-        ChainingIterator.__init__(self, False, True, None, True)
-        self._length = float(length)
-        self.timestamp = CF.get_time_stamp()
 
-    def init(self):
-        pass
-
-    def traverse(self, iter):
-        winner = None
-        winnerOrientation = False
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
-        vertex = self.next_vertex
-        if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            winner = find_matching_vertex(mate.id, it)
-            winnerOrientation = not it.is_incoming if not it.is_end else False
-        ## case of NonTVertex
-        else:
-            for nat in NATURES:
-                if (self.current_edge.nature & nat):
-                    for ve in it:
-                        if (ve.nature & nat):
-                            if winner is not None:
-                                return None
-                            winner = ve
-                            winnerOrientation = not it.is_incoming
-                    break
+    def __init__(self, percent):
+        pyFillOcclusionsChainingIterator.__init__(self, percent=percent, time_stamp=CF.get_time_stamp())
 
-        if winner is not None and winner.time_stamp != self.timestamp:
-            connexl = 0.0
-            _cit = pyChainSilhouetteGenericIterator(False, False)
-            _cit.begin = winner
-            _cit.current_edge = winner
-            _cit.orientation = winnerOrientation
-            _cit.init()
-
-            while (not _cit.is_end) and _cit.object.time_stamp != self.timestamp:
-                connexl += _cit.object.length_2d
-                _cit.increment()
-                if _cit.is_begin:
-                    break
 
-            if connexl > self._length:
-                return None
+class pyFillOcclusionsAbsoluteChainingIterator(pyFillOcclusionsChainingIterator):
+    """Chaining iterator that fills small occlusions
 
-        return winner
+    :arg size: The maximum length of the occluded part in pixels.
+    :type size: int
+    """
+    def __init__(self, length):
+        pyFillOcclusionsChainingIterator.__init__(self, length=length, time_stamp=CF.get_time_stamp())
 
 
-class pyFillOcclusionsAbsoluteAndRelativeChainingIterator(ChainingIterator):
+class pyFillOcclusionsAbsoluteAndRelativeChainingIterator(pyFillOcclusionsChainingIterator):
     """Chaining iterator that fills small occlusions regardless of the
     selection
 
@@ -437,62 +616,10 @@ class pyFillOcclusionsAbsoluteAndRelativeChainingIterator(ChainingIterator):
     :type percent: float
     """
     def __init__(self, percent, l):
-        ChainingIterator.__init__(self, False, True, None, True)
-        self._length = 0.0
-        self._absLength = l
-        self._percent = float(percent)
+        pyFillOcclusionsChainingIterator.__init__(self, percent=percent, length=l)
 
-    def init(self):
-        # each time we're evaluating a chain length
-        # we try to do it once. Thus we reinit
-        # the chain length here:
-        self._length = 0.0
 
-    def traverse(self, iter):
-        winner = None
-        winnerOrientation = False
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
-        vertex = self.next_vertex
-        if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            winner = find_matching_vertex(mate.id, it)
-            winnerOrientation = not it.is_incoming if not it.is_end else False
-        ## case of NonTVertex
-        else:
-            for nat in NATURES:
-                if (self.current_edge.nature & nat):
-                    for ve in it:
-                        if (ve.nature & nat):
-                            if winner is not None:
-                                return None
-                            winner = ve
-                            winnerOrientation = not it.is_incoming
-                    break
-
-        if winner is not None and winner.time_stamp != CF.get_time_stamp():
-
-                if self._length == 0.0:
-                    self._length = get_chain_length(winner, winnerOrientation)
-
-                connexl = 0.0
-                _cit = pyChainSilhouetteGenericIterator(False, False)
-                _cit.begin = winner
-                _cit.current_edge = winner
-                _cit.orientation = winnerOrientation
-                _cit.init()
-                while (not _cit.is_end) and _cit.object.time_stamp != CF.get_time_stamp():
-                    connexl += _cit.object.length_2d
-                    _cit.increment()
-                    if _cit.is_begin:
-                        break
-
-                if (connexl > self._percent * self._length) or (connexl > self._absLength):
-                    return None
-        return winner
-
-
-class pyFillQi0AbsoluteAndRelativeChainingIterator(ChainingIterator):
+class pyFillQi0AbsoluteAndRelativeChainingIterator(pyFillOcclusionsChainingIterator):
     """Chaining iterator that fills small occlusions regardless of the
     selection
 
@@ -501,56 +628,7 @@ class pyFillQi0AbsoluteAndRelativeChainingIterator(ChainingIterator):
     :type percent: float
     """
     def __init__(self, percent, l):
-        ChainingIterator.__init__(self, False, True, None, True)
-        self._length = 0.0
-        self._absLength = l
-        self._percent = percent
-
-    def init(self):
-        # A chain's length should preverably be evaluated only once.
-        # Therefore, the chain length is reset here.
-        self._length = 0.0
-
-    def traverse(self, iter):
-        winner = None
-        winnerOrientation = False
-        it = AdjacencyIterator(iter)
-        ## case of TVertex
-        vertex = self.next_vertex
-        if type(vertex) is TVertex:
-            mate = vertex.get_mate(self.current_edge)
-            winner = find_matching_vertex(mate.id, it)
-            winnerOrientation = not it.is_incoming if not it.is_end else False
-        ## case of NonTVertex
-        else:
-            for nat in NATURES:
-                if (self.current_edge.nature & nat):
-                    for ve in it:
-                        if (ve.nature & nat):
-                            if winner is not None:
-                                return None
-                            winner = ve
-                            winnerOrientation = not it.is_incoming
-                    break
-
-        if winner is not None and winner.qi:
-                if self._length == 0.0:
-                    self._length = get_chain_length(winner, winnerOrientation)
-
-                connexl = 0
-                _cit = pyChainSilhouetteGenericIterator(False, False)
-                _cit.begin = winner
-                _cit.current_edge = winner
-                _cit.orientation = winnerOrientation
-                _cit.init()
-                while (not _cit.is_end) and _cit.object.qi != 0:
-                    connexl += _cit.object.length_2d
-                    _cit.increment()
-                    if _cit.is_begin:
-                        break
-                if (connexl > self._percent * self._length) or (connexl > self._absLength):
-                    return None
-        return winner
+        pyFillOcclusionsChainingIterator.__init__(self, percent=percent, length=l, qi=True)
 
 
 class pyNoIdChainSilhouetteIterator(ChainingIterator):
@@ -567,51 +645,20 @@ class pyNoIdChainSilhouetteIterator(ChainingIterator):
 
     def __init__(self, stayInSelection=True):
         ChainingIterator.__init__(self, stayInSelection, True, None, True)
+        self._restrictions = (stayInSelection, True)
 
     def init(self):
-        pass
+        self._adjacency = get_adjacency_index()
 
     def traverse(self, iter):
-        winner = None
-        it = AdjacencyIterator(iter)
-        # case of TVertex
         vertex = self.next_vertex
+        # case of TVertex
         if type(vertex) is TVertex:
-            for ve in it:
-                # case one
-                vA = self.current_edge.last_fedge.second_svertex
-                vB = ve.first_fedge.first_svertex
-                if vA.id.first == vB.id.first:
-                    return ve
-                # case two
-                vA = self.current_edge.first_fedge.first_svertex
-                vB = ve.last_fedge.second_svertex
-                if vA.id.first == vB.id.first:
-                    return ve
-                # case three
-                vA = self.current_edge.last_fedge.second_svertex
-                vB = ve.last_fedge.second_svertex
-                if vA.id.first == vB.id.first:
-                    return ve
-                # case four
-                vA = self.current_edge.first_fedge.first_svertex
-                vB = ve.first_fedge.first_svertex
-                if vA.id.first == vB.id.first:
-                    return ve
-            return None
+            # the first ViewEdge that shares an SVertex with the current one
+            entry = self._adjacency.sharing_svertex(vertex, self.current_edge, *self._restrictions)
+            return entry[0] if entry is not None else None
         ## case of NonTVertex
         else:
-            for i, nat in enumerate(NATURES):
-                if (nat & self.current_edge.nature):
-                    for ve in it:
-                        ve_nat = ve.nature
-                        if (ve_nat & nat):
-                            if (nat != ve_nat) and any(n & ve_nat for n in NATURES[:i]):
-                                break
-
-                            if winner is not None:
-                                return
-
-                            winner = ve
-                    return winner
-            return None
+            edges = self._adjacency.adjacent_edges(vertex, *self._restrictions)
+            winner = natural_winner(self.current_edge.nature, edges)
+            return winner[0] if winner is not None else None
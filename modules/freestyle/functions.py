@@ -86,8 +86,9 @@ from freestyle.types import (
     UnaryFunction0DVec2f,
     UnaryFunction1DDouble,
     )
-from freestyle.utils import ContextFunctions as CF
-from freestyle.utils import integrate
+from freestyle.utils import pooled_functor
+from freestyle.utils import get_view_map_snapshots
+from freestyle.utils import integrate_values, sample_points_2d
 
 from mathutils import Vector
 
@@ -110,7 +111,7 @@ class CurveMaterialF0D(UnaryFunction0DMaterial):
 
 class pyInverseCurvature2DAngleF0D(UnaryFunction0DDouble):
     def __call__(self, inter):
-        func = Curvature2DAngleF0D()
+        func = pooled_functor(Curvature2DAngleF0D)
         c = func(inter)
         return (3.1415 - c)
 
@@ -123,21 +124,37 @@ class pyCurvilinearLengthF0D(UnaryFunction0DDouble):
 
 
 class pyDensityAnisotropyF0D(UnaryFunction0DDouble):
-    """Estimates the anisotropy of density"""
-    def __init__(self, level):
+    """Estimates the anisotropy of density
+
+    :arg level: the level of the view maps
+    :type level: int
+    :arg bilinear: interpolate between pixels instead of reading the
+        pixel that contains the point
+    :type bilinear: bool
+    """
+    def __init__(self, level, bilinear=False):
         UnaryFunction0DDouble.__init__(self)
-        self.IsoDensity = ReadCompleteViewMapPixelF0D(level)
-        self.d0Density = ReadSteerableViewMapPixelF0D(0, level)
-        self.d1Density = ReadSteerableViewMapPixelF0D(1, level)
-        self.d2Density = ReadSteerableViewMapPixelF0D(2, level)
-        self.d3Density = ReadSteerableViewMapPixelF0D(3, level)
+        self._level = level
+        self._bilinear = bilinear
 
     def __call__(self, inter):
-        c_iso = self.IsoDensity(inter)
-        c_0 = self.d0Density(inter)
-        c_1 = self.d1Density(inter)
-        c_2 = self.d2Density(inter)
-        c_3 = self.d3Density(inter)
+        p = inter.object.point_2d
+        snapshots = get_view_map_snapshots(self._level, (None, 0, 1, 2, 3))
+        return self.evaluate(snapshots, p.x, p.y)
+
+    def evaluate_batch(self, xs, ys):
+        """Returns the anisotropy at every point (xs[i], ys[i]) """
+        snapshots = get_view_map_snapshots(self._level, (None, 0, 1, 2, 3))
+        evaluate = self.evaluate
+        return [evaluate(snapshots, x, y) for x, y in zip(xs, ys)]
+
+    def evaluate(self, snapshots, x, y):
+        iso, d0, d1, d2, d3 = snapshots
+        c_iso = iso.sample(x, y, self._bilinear)
+        c_0 = d0.sample(x, y, self._bilinear)
+        c_1 = d1.sample(x, y, self._bilinear)
+        c_2 = d2.sample(x, y, self._bilinear)
+        c_3 = d3.sample(x, y, self._bilinear)
         cMax = max(max(c_0, c_1), max(c_2, c_3))
         cMin = min(min(c_0, c_1), min(c_2, c_3))
         return 0 if (c_iso == 0) else (cMax - cMin) / c_iso
@@ -148,48 +165,64 @@ class pyViewMapGradientVectorF0D(UnaryFunction0DVec2f):
 
     :arg level: the level at which to compute the gradient
     :type level: int
+    :arg bilinear: interpolate between pixels instead of reading the
+        pixels that contain the sample points
+    :type bilinear: bool
     """
-    def __init__(self, level):
+    def __init__(self, level, bilinear=False):
         UnaryFunction0DVec2f.__init__(self)
         self._l = level
         self._step = pow(2, self._l)
+        self._bilinear = bilinear
 
     def __call__(self, iter):
-        p = iter.object.point_2d
-        gx = CF.read_complete_view_map_pixel(self._l, int(p.x + self._step), int(p.y)) - \
-             CF.read_complete_view_map_pixel(self._l, int(p.x), int(p.y))
-        gy = CF.read_complete_view_map_pixel(self._l, int(p.x), int(p.y + self._step)) - \
-             CF.read_complete_view_map_pixel(self._l, int(p.x), int(p.y))
-        return Vector((gx, gy))
+        return Vector(view_map_gradient(iter.object.point_2d, self._l, self._step, self._bilinear))
 
 
 class pyViewMapGradientNormF0D(UnaryFunction0DDouble):
-    def __init__(self, l):
+    def __init__(self, l, bilinear=False):
         UnaryFunction0DDouble.__init__(self)
         self._l = l
         self._step = pow(2, self._l)
+        self._bilinear = bilinear
 
     def __call__(self, iter):
-        p = iter.object.point_2d
-        gx = CF.read_complete_view_map_pixel(self._l, int(p.x + self._step), int(p.y)) - \
-             CF.read_complete_view_map_pixel(self._l, int(p.x), int(p.y))
-        gy = CF.read_complete_view_map_pixel(self._l, int(p.x), int(p.y + self._step)) - \
-             CF.read_complete_view_map_pixel(self._l, int(p.x), int(p.y))
-        return Vector((gx, gy)).length
+        return Vector(view_map_gradient(iter.object.point_2d, self._l, self._step, self._bilinear)).length
+
+    def evaluate_batch(self, xs, ys):
+        """Returns the gradient norm at every point (xs[i], ys[i]) """
+        snapshot, = get_view_map_snapshots(self._l)
+        step = self._step
+        bilinear = self._bilinear
+        return [Vector(snapshot_gradient(snapshot, x, y, step, bilinear)).length for x, y in zip(xs, ys)]
+
+
+def view_map_gradient(p, level, step, bilinear=False):
+    """Returns the forward differences (gx, gy) of the complete view map at point p """
+    snapshot, = get_view_map_snapshots(level)
+    return snapshot_gradient(snapshot, p.x, p.y, step, bilinear)
+
+
+def snapshot_gradient(snapshot, x, y, step, bilinear=False):
+    """Returns the forward differences (gx, gy) of a ViewMapSnapshot at (x, y) """
+    c = snapshot.sample(x, y, bilinear)
+    gx = snapshot.sample(x + step, y, bilinear) - c
+    gy = snapshot.sample(x, y + step, bilinear) - c
+    return (gx, gy)
 
 # -- Functions for 1D elements (curves) -- #
 
 
 class pyGetInverseProjectedZF1D(UnaryFunction1DDouble):
     def __call__(self, inter):
-        func = GetProjectedZF1D()
+        func = pooled_functor(GetProjectedZF1D)
         z = func(inter)
         return (1.0 - z)
 
 
 class pyGetSquareInverseProjectedZF1D(UnaryFunction1DDouble):
     def __call__(self, inter):
-        func = GetProjectedZF1D()
+        func = pooled_functor(GetProjectedZF1D)
         z = func(inter)
         return (1.0 - pow(z, 2))
 
@@ -202,8 +235,8 @@ class pyDensityAnisotropyF1D(UnaryFunction1DDouble):
         self._sampling = sampling
 
     def __call__(self, inter):
-        v = integrate(self._func, inter.points_begin(self._sampling), inter.points_end(self._sampling), self._integration)
-        return v
+        xs, ys = sample_points_2d(inter, self._sampling, self._integration)
+        return integrate_values(self._func.evaluate_batch(xs, ys), self._integration)
 
 
 class pyViewMapGradientNormF1D(UnaryFunction1DDouble):
@@ -214,5 +247,5 @@ class pyViewMapGradientNormF1D(UnaryFunction1DDouble):
         self._sampling = sampling
 
     def __call__(self, inter):
-        v = integrate(self._func, inter.points_begin(self._sampling), inter.points_end(self._sampling), self._integration)
-        return v
+        xs, ys = sample_points_2d(inter, self._sampling, self._integration)
+        return integrate_values(self._func.evaluate_batch(xs, ys), self._integration)
@@ -23,22 +23,19 @@ definition in Python
 """
 
 # module members
+import _freestyle
 from _freestyle import (
     ContourUP1D,
     DensityLowerThanUP1D,
     EqualToChainingTimeStampUP1D,
-    EqualToTimeStampUP1D,
     ExternalContourUP1D,
     FalseBP1D,
     FalseUP0D,
-    FalseUP1D,
     Length2DBP1D,
-    QuantitativeInvisibilityUP1D,
     SameShapeIdBP1D,
     ShapeUP1D,
     TrueBP1D,
     TrueUP0D,
-    TrueUP1D,
     ViewMapGradientNormBP1D,
     WithinImageBoundaryUP1D,
     )
@@ -52,7 +49,7 @@ from freestyle.types import (
     UnaryPredicate0D,
     UnaryPredicate1D,
     Id,
-    Interface0DIterator,
+    Operators,
     )
 from freestyle.functions import (
     Curvature2DAngleF0D,
@@ -61,17 +58,27 @@ from freestyle.functions import (
     GetCompleteViewMapDensityF1D,
     GetCurvilinearAbscissaF0D,
     GetDirectionalViewMapDensityF1D,
-    GetOccludersF1D,
     GetProjectedZF1D,
-    GetShapeF1D,
     GetSteerableViewMapDensityF1D,
     GetZF1D,
     QuantitativeInvisibilityF0D,
+    QuantitativeInvisibilityF1D,
     ZDiscontinuityF1D,
     pyCurvilinearLengthF0D,
     pyDensityAnisotropyF1D,
     pyViewMapGradientNormF1D,
     )
+from freestyle.utils import (
+    count_turns,
+    get_occluder_ids,
+    get_occlusion_ids,
+    get_shape_ids,
+    id_key,
+    interface1d_id,
+    pooled_functor,
+    supports_many,
+    ViewEdgeColumns,
+    )
 
 import random
 
@@ -154,6 +161,51 @@ class pyParameterUP0D(UnaryPredicate0D):
 
 # -- Unary predicates for 1D elements (curves) -- #
 
+# Unary predicates for 1D elements may implement evaluate_many(columns),
+# which returns the result of the predicate for every ViewEdge of a
+# freestyle.utils.ViewEdgeColumns snapshot as a list of booleans.
+# select_many() below uses it to evaluate a selection at once.
+# Predicates that combine others also implement supports_many(), which
+# tells whether all of their operands implement evaluate_many(); it is
+# checked (see freestyle.utils.supports_many()) before evaluate_many()
+# is called, so that no column is read in vain.
+
+class TrueUP1D(_freestyle.TrueUP1D):
+    __doc__ = _freestyle.TrueUP1D.__doc__
+
+    def evaluate_many(self, columns):
+        return [True] * columns.size
+
+
+class FalseUP1D(_freestyle.FalseUP1D):
+    __doc__ = _freestyle.FalseUP1D.__doc__
+
+    def evaluate_many(self, columns):
+        return [False] * columns.size
+
+
+class QuantitativeInvisibilityUP1D(_freestyle.QuantitativeInvisibilityUP1D):
+    __doc__ = _freestyle.QuantitativeInvisibilityUP1D.__doc__
+
+    def __init__(self, qi=0):
+        _freestyle.QuantitativeInvisibilityUP1D.__init__(self, qi)
+        self._qi = qi
+
+    def evaluate_many(self, columns):
+        return [qi == self._qi for qi in columns.qi]
+
+
+class EqualToTimeStampUP1D(_freestyle.EqualToTimeStampUP1D):
+    __doc__ = _freestyle.EqualToTimeStampUP1D.__doc__
+
+    def __init__(self, ts):
+        _freestyle.EqualToTimeStampUP1D.__init__(self, ts)
+        self._ts = ts
+
+    def evaluate_many(self, columns):
+        return [ts == self._ts for ts in columns.time_stamp]
+
+
 class AndUP1D(UnaryPredicate1D):
     def __init__(self, *predicates):
         UnaryPredicate1D.__init__(self)
@@ -165,6 +217,13 @@ class AndUP1D(UnaryPredicate1D):
     def __call__(self, inter):
         return all(pred(inter) for pred in self.predicates)
 
+    def supports_many(self):
+        return all(supports_many(pred) for pred in self.predicates)
+
+    def evaluate_many(self, columns):
+        masks = [pred.evaluate_many(columns) for pred in self.predicates]
+        return [all(values) for values in zip(*masks)]
+
 
 class OrUP1D(UnaryPredicate1D):
     def __init__(self, *predicates):
@@ -177,14 +236,27 @@ class OrUP1D(UnaryPredicate1D):
     def __call__(self, inter):
         return any(pred(inter) for pred in self.predicates)
 
+    def supports_many(self):
+        return all(supports_many(pred) for pred in self.predicates)
+
+    def evaluate_many(self, columns):
+        masks = [pred.evaluate_many(columns) for pred in self.predicates]
+        return [any(values) for values in zip(*masks)]
+
 
 class NotUP1D(UnaryPredicate1D):
     def __init__(self, pred):
         UnaryPredicate1D.__init__(self)
-        self.__pred = pred
+        self.predicate = pred
 
     def __call__(self, inter):
-        return not self.__pred(inter)
+        return not self.predicate(inter)
+
+    def supports_many(self):
+        return supports_many(self.predicate)
+
+    def evaluate_many(self, columns):
+        return [not value for value in self.predicate.evaluate_many(columns)]
 
 
 class ObjectNamesUP1D(UnaryPredicate1D):
@@ -197,11 +269,14 @@ class ObjectNamesUP1D(UnaryPredicate1D):
         found = viewEdge.viewshape.name in self._names
         return found if not self._negative else not found
 
+    def evaluate_many(self, columns):
+        return [(name in self._names) != self._negative for name in columns.shape_name]
+
 
 class QuantitativeInvisibilityRangeUP1D(UnaryPredicate1D):
     def __init__(self, qi_start, qi_end):
         UnaryPredicate1D.__init__(self)
-        self.__getQI = QuantitativeInvisibilityF1D()
+        self.__getQI = pooled_functor(QuantitativeInvisibilityF1D)
         self.__qi_start = qi_start
         self.__qi_end = qi_end
 
@@ -209,6 +284,9 @@ class QuantitativeInvisibilityRangeUP1D(UnaryPredicate1D):
         qi = self.__getQI(inter)
         return (self.__qi_start <= qi <= self.__qi_end)
 
+    def evaluate_many(self, columns):
+        return [self.__qi_start <= qi <= self.__qi_end for qi in columns.qi]
+
 
 class pyNFirstUP1D(UnaryPredicate1D):
     def __init__(self, n):
@@ -229,30 +307,49 @@ class pyHigherLengthUP1D(UnaryPredicate1D):
     def __call__(self, inter):
         return (inter.length_2d > self._l)
 
+    def evaluate_many(self, columns):
+        return [length > self._l for length in columns.length_2d]
+
+
+class pyHigherChainLengthUP1D(UnaryPredicate1D):
+    """
+    Selects the ViewEdges whose natural chain (see
+    freestyle.chainingiterators.ChainGraph) is longer than l.
+    Only meaningful for ViewEdges, i.e. before chaining.
+    """
+    def __init__(self, l):
+        UnaryPredicate1D.__init__(self)
+        self._l = l
+
+    def __call__(self, inter):
+        # chainingiterators imports this module
+        from freestyle.chainingiterators import get_chain_graph
+        chain, position = get_chain_graph().chain_of(inter, True)
+        return (chain.length > self._l)
+
 
 class pyNatureUP1D(UnaryPredicate1D):
     def __init__(self, nature):
         UnaryPredicate1D.__init__(self)
         self._nature = nature
-        self._getNature = CurveNatureF1D()
+        self._getNature = pooled_functor(CurveNatureF1D)
 
     def __call__(self, inter):
         return bool(self._getNature(inter) & self._nature)
 
+    def evaluate_many(self, columns):
+        return [bool(nature & self._nature) for nature in columns.nature]
+
 
 class pyHigherNumberOfTurnsUP1D(UnaryPredicate1D):
     def __init__(self, n, a):
         UnaryPredicate1D.__init__(self)
         self._n = n
         self._a = a
-        self.func = Curvature2DAngleF0D()
 
     def __call__(self, inter):
-        it = Interface0DIterator(inter)
-        # sum the turns, check against n
-        return sum(1 for _ in it if self.func(it) > self._a) > self._n
-        # interesting fact, the line above is 70% faster than:
-        # return sum(self.func(it) > self._a for _ in it) > self._n
+        # count the turns, stopping as soon as there are more than n
+        return count_turns(inter, self._a, self._n) > self._n
 
 
 class pyDensityUP1D(UnaryPredicate1D):
@@ -273,10 +370,10 @@ class pyLowSteerableViewMapDensityUP1D(UnaryPredicate1D):
         self._threshold = threshold
         self._level = level
         self._integration = integration
+        self._func = pooled_functor(GetSteerableViewMapDensityF1D, level, integration)
 
     def __call__(self, inter):
-        func = GetSteerableViewMapDensityF1D(self._level, self._integration)
-        return (func(inter) < self._threshold)
+        return (self._func(inter) < self._threshold)
 
 
 class pyLowDirectionalViewMapDensityUP1D(UnaryPredicate1D):
@@ -286,10 +383,10 @@ class pyLowDirectionalViewMapDensityUP1D(UnaryPredicate1D):
         self._orientation = orientation
         self._level = level
         self._integration = integration
+        self._func = pooled_functor(GetDirectionalViewMapDensityF1D, orientation, level, integration)
 
     def __call__(self, inter):
-        func = GetDirectionalViewMapDensityF1D(self._orientation, self._level, self._integration)
-        return (func(inter) < self._threshold)
+        return (self._func(inter) < self._threshold)
 
 
 class pyHighSteerableViewMapDensityUP1D(UnaryPredicate1D):
@@ -353,10 +450,10 @@ class pyIsOccludedByUP1D(UnaryPredicate1D):
         if not isinstance(id, Id):
             raise TypeError("pyIsOccludedByUP1D expected freestyle.types.Id, not " + type(id).__name__)
         self._id = id
+        self._key = id_key(id)
 
     def __call__(self, inter):
-        shapes = GetShapeF1D()(inter)
-        if any(s.id == self._id for s in shapes):
+        if self._key in get_shape_ids(inter):
             return False
 
         # construct iterators
@@ -367,13 +464,13 @@ class pyIsOccludedByUP1D(UnaryPredicate1D):
         vertex = next(it)
         if type(vertex) is TVertex:
             eit = vertex.edges_begin()
-            if any(ve.id == self._id for (ve, incoming) in eit):
+            if any(id_key(ve.id) == self._key for (ve, incoming) in eit):
                 return True
 
         vertex = next(itlast)
         if type(vertex) is TVertex:
-            eit = tvertex.edges_begin()
-            if any(ve.id == self._id for (ve, incoming) in eit):
+            eit = vertex.edges_begin()
+            if any(id_key(ve.id) == self._key for (ve, incoming) in eit):
                 return True
         return False
 
@@ -382,53 +479,53 @@ class pyIsInOccludersListUP1D(UnaryPredicate1D):
     def __init__(self, id):
         UnaryPredicate1D.__init__(self)
         self._id = id
+        self._key = id_key(id)
 
     def __call__(self, inter):
-        occluders = GetOccludersF1D()(inter)
-        return any(a.id == self._id for a in occluders)
+        return self._key in get_occluder_ids(inter)
 
 
 class pyIsOccludedByItselfUP1D(UnaryPredicate1D):
-    def __init__(self):
-        UnaryPredicate1D.__init__(self)
-        self.__func1 = GetOccludersF1D()
-        self.__func2 = GetShapeF1D()
-
     def __call__(self, inter):
-        lst1 = self.__func1(inter)
-        lst2 = self.__func2(inter)
-        return any(vs1.id == vs2.id for vs1 in lst1 for vs2 in lst2)
+        occluders, shapes = get_occlusion_ids(inter)
+        return not occluders.isdisjoint(shapes)
 
 
 class pyIsOccludedByIdListUP1D(UnaryPredicate1D):
     def __init__(self, idlist):
         UnaryPredicate1D.__init__(self)
         self._idlist = idlist
-        self.__func1 = GetOccludersF1D()
+        self._keys = frozenset(id_key(_id) for _id in idlist)
 
     def __call__(self, inter):
-        lst1 = self.__func1(inter.object)
-        return any(vs1.id == _id for vs1 in lst1 for _id in self._idlist)
+        return not self._keys.isdisjoint(get_occluder_ids(inter))
 
 
 class pyShapeIdListUP1D(UnaryPredicate1D):
     def __init__(self, idlist):
         UnaryPredicate1D.__init__(self)
         self._funcs = tuple(ShapeUP1D(_id, 0) for _id in idlist)
+        self._keys = frozenset((_id, 0) for _id in idlist)
 
     def __call__(self, inter):
         return any(func(inter) for func in self._funcs)
 
+    def evaluate_many(self, columns):
+        return [key in self._keys for key in columns.shape_id]
+
 
 # DEPRECATED
 class pyShapeIdUP1D(UnaryPredicate1D):
     def __init__(self, _id):
         UnaryPredicate1D.__init__(self)
         self._id = _id
+        self._key = id_key(_id)
 
     def __call__(self, inter):
-        shapes = GetShapeF1D()(inter)
-        return any(a.id == self._id for a in shapes)
+        return self._key in get_shape_ids(inter)
+
+    def evaluate_many(self, columns):
+        return [key == self._key for key in columns.shape_id]
 
 
 class pyHighDensityAnisotropyUP1D(UnaryPredicate1D):
@@ -470,7 +567,7 @@ class pyDensityVariableSigmaUP1D(UnaryPredicate1D):
         sigma = (self._sigmaMax - self._sigmaMin) / (self._lmax - self._lmin) * result + self._sigmaMin
         t = (self._tmax - self._tmin) / (self._lmax - self._lmin) * result + self._tmin
         sigma = max(sigma, self._sigmaMin)
-        self._func = DensityF1D(sigma, self._integration, self._sampling)
+        self._func = pooled_functor(DensityF1D, sigma, self._integration, self._sampling)
         return (self._func(inter) < t)
 
 
@@ -482,6 +579,164 @@ class pyClosedCurveUP1D(UnaryPredicate1D):
         return (next(it).id == next(itlast).id)
 
 
+# -- Selection of unary predicates for 1D elements -- #
+
+class IdSetUP1D(UnaryPredicate1D):
+    """Selects the Interface1Ds whose id (see id_key) is in keys """
+    def __init__(self, keys):
+        UnaryPredicate1D.__init__(self)
+        self._keys = keys
+
+    def __call__(self, inter):
+        return id_key(inter.id) in self._keys
+
+
+def select_many(pred):
+    """
+    Operators.select(pred), but when pred supports evaluate_many(), it is
+    evaluated over a column snapshot of the ViewEdges at once, and the
+    selection only costs one set lookup per ViewEdge.  Returns True if
+    the batch path was taken.
+    """
+    if supports_many(pred):
+        columns = ViewEdgeColumns()
+        # the ids of ViewEdges are expected to be unique; if not, a mask
+        # cannot be mapped back to the ViewEdges
+        if len(frozenset(columns.ids)) == columns.size:
+            mask = pred.evaluate_many(columns)
+            keys = frozenset(key for key, selected in zip(columns.ids, mask) if selected)
+            Operators.select(IdSetUP1D(keys))
+            return True
+    Operators.select(pred)
+    return False
+
+
+# -- predicate compilation -- #
+
+class MemoUP1D(UnaryPredicate1D):
+    """
+    Evaluates pred once per Interface1D, for subtrees that appear more
+    than once in a predicate tree.  The operands of AndUP1D and OrUP1D
+    all receive the very same Interface1D object, so the result for the
+    last one is kept.
+    """
+    def __init__(self, pred):
+        UnaryPredicate1D.__init__(self)
+        self.predicate = pred
+        self._inter = None
+        self._result = False
+
+    def __call__(self, inter):
+        if inter is not self._inter:
+            self._result = self.predicate(inter)
+            self._inter = inter
+        return self._result
+
+    def supports_many(self):
+        return supports_many(self.predicate)
+
+    def evaluate_many(self, columns):
+        return self.predicate.evaluate_many(columns)
+
+
+def predicate_key(pred):
+    """
+    Returns a key that is equal for predicates that give the same results.
+    Only predicates implementing evaluate_many() (which depend on nothing
+    but the Interface1D) are compared by their attributes.
+    """
+    if hasattr(pred, "evaluate_many"):
+        try:
+            key = (type(pred), tuple(sorted(vars(pred).items())))
+            hash(key)
+            return key
+        except TypeError:
+            pass
+    return id(pred)
+
+
+def compile_predicate(pred):
+    """
+    Returns a UnaryPredicate1D that gives the same results as pred with
+    fewer Python calls per Interface1D: nested AndUP1D and OrUP1D are
+    flattened, TrueUP1D and FalseUP1D operands are folded, double
+    negations and repeated operands are removed, and subtrees that
+    appear more than once are evaluated only once.
+    """
+    nodes = {}
+    keys = {}
+
+    def node_of(key, make):
+        node = nodes.get(key)
+        if node is None:
+            node = nodes[key] = make()
+            keys[id(node)] = key
+        return node
+
+    def simplify(pred):
+        if isinstance(pred, NotUP1D):
+            operand = simplify(pred.predicate)
+            if isinstance(operand, NotUP1D):
+                return operand.predicate
+            if isinstance(operand, TrueUP1D):
+                return node_of((FalseUP1D,), FalseUP1D)
+            if isinstance(operand, FalseUP1D):
+                return node_of((TrueUP1D,), TrueUP1D)
+            return node_of((NotUP1D, keys[id(operand)]), lambda: NotUP1D(operand))
+        for cls, neutral, absorbing in ((AndUP1D, TrueUP1D, FalseUP1D), (OrUP1D, FalseUP1D, TrueUP1D)):
+            if isinstance(pred, cls):
+                operands = []
+                for operand in map(simplify, pred.predicates):
+                    if isinstance(operand, absorbing):
+                        return operand
+                    for operand in (operand.predicates if isinstance(operand, cls) else (operand,)):
+                        if not isinstance(operand, neutral) and all(operand is not op for op in operands):
+                            operands.append(operand)
+                if not operands:
+                    return node_of((neutral,), neutral)
+                if len(operands) == 1:
+                    return operands[0]
+                key = (cls,) + tuple(keys[id(operand)] for operand in operands)
+                return node_of(key, lambda: cls(*operands))
+        return node_of(predicate_key(pred), lambda: pred)
+
+    def operands_of(node):
+        if isinstance(node, NotUP1D):
+            return (node.predicate,)
+        if isinstance(node, (AndUP1D, OrUP1D)):
+            return node.predicates
+        return ()
+
+    uses = {}
+
+    def count(node):
+        uses[id(node)] = uses.get(id(node), 0) + 1
+        if uses[id(node)] == 1:
+            for operand in operands_of(node):
+                count(operand)
+
+    built = {}
+
+    def rebuild(node):
+        result = built.get(id(node))
+        if result is None:
+            if isinstance(node, NotUP1D):
+                result = NotUP1D(rebuild(node.predicate))
+            elif isinstance(node, (AndUP1D, OrUP1D)):
+                result = type(node)(*map(rebuild, node.predicates))
+                # a shared NotUP1D or leaf would cost as many calls as it saves
+                if uses[id(node)] > 1:
+                    result = MemoUP1D(result)
+            else:
+                result = node
+            built[id(node)] = result
+        return result
+
+    root = simplify(pred)
+    count(root)
+    return rebuild(root)
+
+
 # -- Binary predicates for 1D elements (curves) -- #
 
 class AndBP1D(BinaryPredicate1D):
@@ -538,9 +793,33 @@ class pyLengthBP1D(BinaryPredicate1D):
         return (i1.length_2d > i2.length_2d)
 
 
+class pyKeyBP1D(BinaryPredicate1D):
+    """
+    Orders Interface1Ds by increasing key, or by decreasing key if
+    reverse is True.  keys maps identify(inter) to the key of every
+    Interface1D, where identify defaults to freestyle.utils.interface1d_id;
+    without keys, the key function func is evaluated for every comparison.
+    """
+    def __init__(self, func, reverse=False, keys=None, identify=interface1d_id):
+        BinaryPredicate1D.__init__(self)
+        self._func = func
+        self._reverse = reverse
+        self._keys = keys
+        self._identify = identify
+
+    def __call__(self, i1, i2):
+        if self._keys is not None:
+            k1 = self._keys[self._identify(i1)]
+            k2 = self._keys[self._identify(i2)]
+        else:
+            k1 = self._func(i1)
+            k2 = self._func(i2)
+        return (k1 > k2) if self._reverse else (k1 < k2)
+
+
 class pySilhouetteFirstBP1D(BinaryPredicate1D):
     def __call__(self, inter1, inter2):
-        bpred = SameShapeIdBP1D()
+        bpred = pooled_functor(SameShapeIdBP1D)
         if (not bpred(inter1, inter2)):
             return False
         if (inter1.nature & Nature.SILHOUETTE):
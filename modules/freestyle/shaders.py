@@ -81,9 +81,15 @@ from freestyle.predicates import (
 from freestyle.utils import (
     bound,
     bounding_box,
-    phase_to_direction,
+    debug_enabled,
+    ellipse_points,
     pairwise,
+    polygon_points,
+    set_points,
     stroke_curvature,
+    add_caps,
+    round_cap_profile,
+    diffuse_points,
     )
 
 from freestyle.utils import ContextFunctions as CF
@@ -94,7 +100,6 @@ from random import randint
 from functools import namedtuple
 from itertools import islice
 
-import bpy
 import random
 
 
@@ -632,7 +637,7 @@ class py2DCurvatureColorShader(StrokeShader):
         it = Interface0DIterator(stroke)
         for svert in it:
             c = func(it)
-            if c < 0 and bpy.app.debug_freestyle:
+            if c < 0 and debug_enabled():
                 print("py2DCurvatureColorShader: negative 2D curvature")
             color = 10.0 * c / pi
             svert.attribute.color = (color, color, color)
@@ -755,20 +760,23 @@ class pyDiffusion2Shader(StrokeShader):
     Iteratively adds an offset to the position of each stroke vertex
     in the direction perpendicular to the stroke direction at the
     point. The offset is scaled by the 2D curvature (i.e. how quickly
-    the stroke curve is) at the point.
+    the stroke curve is) at the point.  If a tolerance is given, the
+    iterations stop once no vertex moves further than it.
     """
-    def __init__(self, lambda1, nbIter):
+    def __init__(self, lambda1, nbIter, tolerance=None):
         StrokeShader.__init__(self)
         self._lambda = lambda1
         self._nbIter = nbIter
+        self._tolerance = tolerance
         self._normalInfo = Normal2DF0D()
-        self._curvatureInfo = Curvature2DAngleF0D()
 
     def shade(self, stroke):
-        for i in range (1, self._nbIter):
-            it = Interface0DIterator(stroke)
-            for svert in it:
-                svert.point += self._normalInfo(it) * self._lambda * self._curvatureInfo(it)
+        it = Interface0DIterator(stroke)
+        normals = tuple(self._normalInfo(it) for _ in it)
+        # the points are diffused as a whole and written back once
+        xs, ys = diffuse_points((svert.point.x for svert in stroke), (svert.point.y for svert in stroke),
+                                normals, self._lambda, self._nbIter - 1, self._tolerance)
+        set_points(stroke, xs, ys)
         stroke.update_length()
 
 class pyTipRemoverShader(StrokeShader):
@@ -806,7 +814,7 @@ class pyTipRemoverShader(StrokeShader):
 
         stroke.update_length()
         stroke.resample(n)
-        if len(stroke) != n and bpy.app.debug_freestyle:
+        if len(stroke) != n and debug_enabled():
             print("pyTipRemover: Warning: resampling problem")
 
         for svert, a in zip(stroke, oldAttributes):
@@ -930,35 +938,28 @@ class pyBluePrintCirclesShader(StrokeShader):
         C = self.__random_center
 
         """
-        The directions (and phases) are calculated using a seperate function decorated with
+        The phases and directions are calculated using a seperate function decorated with
         an lru-cache. This guarantees that the directions (involving sin and cos) are calculated
         as few times as possible.
 
         This works because the phases and directions are only dependant on the stroke length, and the
         chance that stroke.resample() above produces strokes of the same length is quite high.
 
-        In tests, the ammount of calls to sin and cos went from over 21000 to just 32 times, yielding a
-        speedup of over 100%
+        The points themselves are computed with plain float arithmetic on arrays (no Vectors are
+        created per vertex), and written to the stroke in a single pass.
         """
-        directions = phase_to_direction(sv_nb)
-
-        it = iter(stroke)
-
+        centers = [tuple(center)]
+        radii = [(radius, radius)]
         for j in range(self.__turns):
-            prev_radius = radius
-            prev_center = center
             radius += randint(-R, R)
-            center += Vector((randint(-C, C), randint(-C, C)))
-
-            for (phase, direction), svert in zip(directions, it):
-                r = prev_radius + (radius - prev_radius) * phase
-                c = prev_center + (center - prev_center) * phase
-                svert.point = c + r * direction
+            centers.append((centers[-1][0] + randint(-C, C), centers[-1][1] + randint(-C, C)))
+            radii.append((radius, radius))
 
-        if not it.is_end:
-            it.increment()
-            for sv in tuple(it):
-                stroke.remove_vertex(sv)
+        xs, ys = ellipse_points(sv_nb, centers, radii)
+        n = set_points(stroke, xs, ys)
+        # remove exessive vertices
+        for sv in tuple(islice(stroke, n, None)):
+            stroke.remove_vertex(sv)
 
         stroke.update_length()
 
@@ -984,25 +985,18 @@ class pyBluePrintEllipsesShader(StrokeShader):
         R = self.__random_radius
         C = self.__random_center
 
-        # for description of the line below, see pyBluePrintCirclesShader
-        directions = phase_to_direction(sv_nb)
-        it = iter(stroke)
+        # for a description of the lines below, see pyBluePrintCirclesShader
+        centers = [tuple(center)]
+        radii = [tuple(radius)]
         for j in range(self.__turns):
-            prev_radius = radius
-            prev_center = center
-            radius = radius + Vector((randint(-R, R), randint(-R, R)))
-            center = center + Vector((randint(-C, C), randint(-C, C)))
-
-            for (phase, direction), svert in zip(directions, it):
-                r = prev_radius + (radius - prev_radius) * phase
-                c = prev_center + (center - prev_center) * phase
-                svert.point = (c.x + r.x * direction.x, c.y + r.y * direction.y)
+            radii.append((radii[-1][0] + randint(-R, R), radii[-1][1] + randint(-R, R)))
+            centers.append((centers[-1][0] + randint(-C, C), centers[-1][1] + randint(-C, C)))
 
+        xs, ys = ellipse_points(sv_nb, centers, radii)
+        n = set_points(stroke, xs, ys)
         # remove exessive vertices
-        if not it.is_end:
-            it.increment()
-            for sv in tuple(it):
-                stroke.remove_vertex(sv)
+        for sv in tuple(islice(stroke, n, None)):
+            stroke.remove_vertex(sv)
 
         stroke.update_length()
 
@@ -1063,32 +1057,16 @@ class pyBluePrintSquaresShader(StrokeShader):
         # substract even from uneven; result is length four tuple of vectors
         old_vecs = tuple(next(it) - current for current in it)
 
-        it = iter(stroke)
-        verticesToRemove = list()
-        for j in range(self.__turns):
-            for i, svert in zip(range(num_segments), it):
-                if i < first:
-                    svert.point = points[0] + old_vecs[0] * i / (first - 1)
-                    svert.attribute.visible = (i != first - 1)
-                elif i < second:
-                    svert.point = points[2] + old_vecs[1] * (i - first) / (second - first - 1)
-                    svert.attribute.visible = (i != second - 1)
-                elif i < third:
-                    svert.point = points[4] + old_vecs[2] * (i - second) / (third - second - 1)
-                    svert.attribute.visible = (i != third - 1)
-                elif i < fourth:
-                    svert.point = points[6] + old_vecs[3] * (i - third) / (fourth - third - 1)
-                    svert.attribute.visible = (i != fourth - 1)
-                else:
-                    # special case; remove these vertices
-                    verticesToRemove.append(svert)
+        # every turn traces the same square
+        xs, ys, visible = polygon_points((points[0], points[2], points[4], points[6]), old_vecs, (0, first, second, third, fourth))
+        xs *= self.__turns
+        ys *= self.__turns
+        visible *= self.__turns
 
+        n = set_points(stroke, xs, ys, visible)
         # remove exessive vertices (if any)
-        if not it.is_end:
-            it.increment()
-            verticesToRemove += [svert for svert in it]
-            for sv in verticesToRemove:
-                stroke.remove_vertex(sv)
+        for sv in tuple(islice(stroke, n, None)):
+            stroke.remove_vertex(sv)
         stroke.update_length()
 
 
@@ -1154,47 +1132,24 @@ class pyBluePrintDirectedSquaresShader(StrokeShader):
            -e1 * bb_len1 * 2,
             )
 
-        it = iter(stroke)
-        verticesToRemove = list()
-        for j in range(self.__turns):
-            for i, svert in zip(range(num_segments), it):
-                if i < first:
-                    svert.point = points[0] + old_vecs[0] * i / (first - 1)
-                    svert.attribute.visible = (i != first - 1)
-                elif i < second:
-                    svert.point = points[1] + old_vecs[1] * (i - first) / (second - first - 1)
-                    svert.attribute.visible = (i != second - 1)
-                elif i < third:
-                    svert.point = points[2] + old_vecs[2] * (i - second) / (third - second - 1)
-                    svert.attribute.visible = (i != third - 1)
-                elif i < fourth:
-                    svert.point = points[3] + old_vecs[3] * (i - third) / (fourth - third - 1)
-                    svert.attribute.visible = (i != fourth - 1)
-                else:
-                    # special case; remove these vertices
-                    verticesToRemove.append(svert)
+        # every turn traces the same square
+        xs, ys, visible = polygon_points(points, old_vecs, (0, first, second, third, fourth))
+        xs *= self.__turns
+        ys *= self.__turns
+        visible *= self.__turns
 
-        # remove exessive vertices
-        if not it.is_end:
-            it.increment()
-            verticesToRemove += [svert for svert in it]
-            for sv in verticesToRemove:
-                stroke.remove_vertex(sv)
+        n = set_points(stroke, xs, ys, visible)
+        # remove exessive vertices (if any)
+        for sv in tuple(islice(stroke, n, None)):
+            stroke.remove_vertex(sv)
         stroke.update_length()
 
 
 # -- various (used in the parameter editor) -- #
 
 class RoundCapShader(StrokeShader):
-    def round_cap_thickness(self, x):
-        x = max(0.0, min(x, 1.0))
-        return pow(1.0 - (x ** 2.0), 0.5)
-
     def shade(self, stroke):
-        # save the location and attribute of stroke vertices
-        buffer = tuple((Vector(sv.point), StrokeAttribute(sv.attribute)) for sv in stroke)
-        nverts = len(buffer)
-        if nverts < 2:
+        if len(stroke) < 2:
             return
         # calculate the number of additional vertices to form caps
         thickness_beg = sum(stroke[0].attribute.thickness)
@@ -1205,66 +1160,35 @@ class RoundCapShader(StrokeShader):
         caplen_end = (thickness_end) / 2.0
         nverts_end = max(5, int(thickness_end))
 
-        # adjust the total number of stroke vertices
-        stroke.resample(nverts + nverts_beg + nverts_end)
-        # restore the location and attribute of the original vertices
-        for i, (p, attr) in enumerate(buffer):
-            stroke[nverts_beg + i].point = p
-            stroke[nverts_beg + i].attribute = attr
-        # reshape the cap at the beginning of the stroke
-        q, attr = buffer[1]
-        p, attr = buffer[0]
+        # shape the cap at the beginning of the stroke
+        p, q = Vector(stroke[0].point), stroke[1].point
         direction = (p - q).normalized() * caplen_beg
         n = 1.0 / nverts_beg
-        R, L = attr.thickness
-        for t, svert in zip(range(nverts_beg, 0, -1), stroke):
-            r = self.round_cap_thickness((t + 1) * n)
-            svert.point = p + direction * t * n
-            svert.attribute = attr
-            svert.attribute.thickness = (R * r, L * r)
-        # reshape the cap at the end of the stroke
-        q, attr = buffer[-2]
-        p, attr = buffer[-1]
-        direction = (p - q).normalized() * caplen_beg
+        points_beg = tuple(p + direction * t * n for t in range(nverts_beg, 0, -1))
+        # shape the cap at the end of the stroke
+        p, q = Vector(stroke[-1].point), stroke[-2].point
+        direction = (p - q).normalized() * caplen_end
         n = 1.0 / nverts_end
-        R, L = attr.thickness
-        for t, svert in zip(range(nverts_end, 0, -1), reversed(stroke)):
-            r = self.round_cap_thickness((t + 1) * n)
-            svert.point = p + direction * t * n
-            svert.attribute = attr
-            svert.attribute.thickness = (R * r, L * r)
+        points_end = tuple(p + direction * t * n for t in range(nverts_end, 0, -1))
+        add_caps(stroke, (points_beg, round_cap_profile(nverts_beg)),
+                 (points_end, round_cap_profile(nverts_end)))
         # update the curvilinear 2D length of each vertex
         stroke.update_length()
 
 class SquareCapShader(StrokeShader):
     def shade(self, stroke):
-        # save the location and attribute of stroke vertices
-        buffer = tuple((Vector(sv.point), StrokeAttribute(sv.attribute)) for sv in stroke)
-        nverts = len(buffer)
-        if nverts < 2:
+        if len(stroke) < 2:
             return
-        # calculate the number of additional vertices to form caps
+        # calculate the length of the caps
         caplen_beg = sum(stroke[0].attribute.thickness) / 2.0
-        nverts_beg = 1
-
         caplen_end = sum(stroke[-1].attribute.thickness) / 2.0
-        nverts_end = 1
-        # adjust the total number of stroke vertices
-        stroke.resample(nverts + nverts_beg + nverts_end)
-        # restore the location and attribute of the original vertices
-        for i, (p, attr) in zip(range(nverts), buffer):
-            stroke[nverts_beg + i].point = p
-            stroke[nverts_beg + i].attribute = attr
-        # reshape the cap at the beginning of the stroke
-        q, attr = buffer[1]
-        p, attr = buffer[0]
-        stroke[0].point += (p - q).normalized() * caplen_beg
-        stroke[0].attribute = attr
-        # reshape the cap at the end of the stroke
-        q, attr = buffer[-2]
-        p, attr = buffer[-1]
-        stroke[-1].point += (p - q).normalized() * caplen_end
-        stroke[-1].attribute = attr
+        # shape the cap at the beginning of the stroke
+        p, q = Vector(stroke[0].point), stroke[1].point
+        point_beg = p + (p - q).normalized() * caplen_beg
+        # shape the cap at the end of the stroke
+        p, q = Vector(stroke[-1].point), stroke[-2].point
+        point_end = p + (p - q).normalized() * caplen_end
+        add_caps(stroke, ((point_beg,), (1.0,)), ((point_end,), (1.0,)))
         # update the curvilinear 2D length of each vertex
         stroke.update_length()
 
@@ -21,6 +21,7 @@ Submodule containing all Freestyle types
 """
 
 # module members
+import _freestyle
 from _freestyle import (
     AdjacencyIterator,
     BBox,
@@ -45,7 +46,6 @@ from _freestyle import (
     Nature,
     Noise,
     NonTVertex,
-    Operators,
     SShape,
     SVertex,
     SVertexIterator,
@@ -87,3 +87,51 @@ from _freestyle import (
 
 
 
+
+
+def _validate_frame_caches():
+    # utils imports this module
+    from freestyle.utils import validate_frame_caches
+    validate_frame_caches()
+
+
+class Operators(_freestyle.Operators):
+    # The operators validate the per-frame caches of freestyle.utils once
+    # before they run, so that the predicates, chaining iterators and
+    # shaders they call can look them up per element at no cost.
+    __doc__ = _freestyle.Operators.__doc__
+
+    @staticmethod
+    def select(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.select(*args, **kwargs)
+
+    @staticmethod
+    def chain(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.chain(*args, **kwargs)
+
+    @staticmethod
+    def bidirectional_chain(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.bidirectional_chain(*args, **kwargs)
+
+    @staticmethod
+    def sequential_split(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.sequential_split(*args, **kwargs)
+
+    @staticmethod
+    def recursive_split(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.recursive_split(*args, **kwargs)
+
+    @staticmethod
+    def sort(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.sort(*args, **kwargs)
+
+    @staticmethod
+    def create(*args, **kwargs):
+        _validate_frame_caches()
+        return _freestyle.Operators.create(*args, **kwargs)
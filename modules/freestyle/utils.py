@@ -23,19 +23,33 @@ Helper functions used for Freestyle style module writing
 # module members
 from _freestyle import (
     ContextFunctions,
+    GetOccludeeF1D,
+    GetOccludersF1D,
+    GetShapeF1D,
     getCurrentScene,
     integrate,
     )
 
 from freestyle.types import (
+    Chain,
+    ChainingIterator,
+    IntegrationType,
     Interface0DIterator,
+    Operators,
+    StrokeAttribute,
+    TVertex,
+    ViewEdge,
     )
 
 
 from mathutils import Vector
-from functools import lru_cache
-from math import cos, sin, pi
-from itertools import tee
+from array import array
+from functools import lru_cache, wraps
+from math import acos, cos, sin, sqrt, pi
+from itertools import chain, islice, tee
+from operator import attrgetter
+from time import perf_counter
+from types import FunctionType
 
 
 # -- real utility functions  -- #
@@ -60,9 +74,39 @@ def bounding_box(stroke):
     x, y = zip(*(svert.point for svert in stroke))
     return (Vector((min(x), min(y))), Vector((max(x), max(y))))
 
+# -- functor pooling -- #
+
+# float parameters of pooled functors are rounded to multiples of this step
+FUNCTOR_QUANTUM = 1.0 / 64.0
+
+
+@lru_cache(maxsize=256)
+def cached_functor(cls, args):
+    return cls(*args)
+
+
+def pooled_functor(cls, *args):
+    """
+    Returns a functor equivalent to cls(*args), shared by all callers that ask for
+    the same parameters, so that hot loops do not allocate new (C) functors.
+    Float parameters are rounded to multiples of FUNCTOR_QUANTUM, and the least
+    recently used functors are evicted.
+    """
+    return cached_functor(cls, tuple(round(arg / FUNCTOR_QUANTUM) * FUNCTOR_QUANTUM
+                                     if isinstance(arg, float) else arg for arg in args))
+
 # -- General helper functions -- #
 
 
+def debug_enabled():
+    """
+    Returns True when Blender runs with --debug-freestyle.
+    bpy is imported on first use, so that importing this module stays cheap.
+    """
+    import bpy
+    return bpy.app.debug_freestyle
+
+
 @lru_cache(maxsize=32)
 def phase_to_direction(length):
     """
@@ -77,12 +121,123 @@ def phase_to_direction(length):
     return results
 
 
+# -- per-frame caching -- #
+
+_cache_generation = 0
+# the frame key and the time stamp seen by the last validate_frame_caches()
+_validated_key = None
+_validated_time_stamp = 0
+
+
+def reset_frame_caches(*args):
+    """
+    Invalidates every FrameCache. Needed whenever a new view map is built:
+    it is called before every render (see register_frame_cache_handler),
+    by the parameter editor for every new render layer, and by
+    validate_frame_caches()
+    """
+    global _cache_generation
+    _cache_generation += 1
+
+
+def register_frame_cache_handler():
+    """
+    Resets the frame caches before every render, so that rendering the
+    same frame again does not reuse the ViewEdges of a freed view map.
+    Called by the parameter editor; registering the handler again has no
+    effect.  bpy is imported here, so that importing this module stays cheap.
+    """
+    from bpy.app.handlers import persistent, render_pre
+    if reset_frame_caches not in render_pre:
+        render_pre.append(persistent(reset_frame_caches))
+
+
+def get_frame_key():
+    """Returns a key that identifies the frame that is currently rendered """
+    scene = getCurrentScene()
+    return (scene.name, scene.frame_current)
+
+
+def validate_frame_caches():
+    """
+    Invalidates every FrameCache when another scene or frame is rendered
+    than at the last call, or when the time stamp has been reset (a new
+    view map).  freestyle.types.Operators calls it once per operator, so
+    that lookups made per element only compare a counter.
+    """
+    global _validated_key, _validated_time_stamp
+    key = get_frame_key()
+    time_stamp = ContextFunctions.get_time_stamp()
+    if key != _validated_key or time_stamp < _validated_time_stamp:
+        reset_frame_caches()
+        _validated_key = key
+    _validated_time_stamp = time_stamp
+
+
+class FrameCache(dict):
+    """
+    A dictionary whose contents are only valid for a single frame (view map).
+    current() returns the cache, emptied if the caches have been invalidated
+    since it was last used; it is cheap enough to be called per element.
+    check() validates the caches first (see validate_frame_caches), for
+    code that does not run inside an operator.
+    """
+    def __init__(self):
+        dict.__init__(self)
+        self._generation = None
+
+    def check(self):
+        validate_frame_caches()
+        return self.current()
+
+    def current(self):
+        if self._generation != _cache_generation:
+            self.clear()
+            self._generation = _cache_generation
+        return self
+
+
+def id_key(id):
+    """Returns a hashable (first, second) tuple for the given Id """
+    return (id.first, id.second)
+
+
 # -- helper functions for chaining -- #
 
 def get_chain_length(ve, orientation):
-    """Returns the 2d length of a given ViewEdge """
+    """
+    Returns the 2d length of the chain a given ViewEdge belongs to.
+    The length is looked up in the chain graph of the current frame.
+    """
+    from freestyle.chainingiterators import get_chain_graph
+    chain, position = get_chain_graph().chain_of(ve, orientation)
+    return chain.length
+
+
+_gap_lengths = FrameCache()
+
+
+def get_gap_length(ve, orientation, criterion):
+    """
+    Returns the 2d length of the run of hidden ViewEdges that starts at a
+    given ViewEdge and follows its chain in the given orientation.
+    criterion is ('time_stamp', ts) if ViewEdges with time stamp ts are
+    visible, or ('qi',) if ViewEdges with a quantitative invisibility of 0
+    are. The length is cached for every ViewEdge on the run, for the
+    duration of a frame.
+    """
+    cache = _gap_lengths.current()
+    key = (id_key(ve.id), orientation, criterion)
+    length = cache.get(key)
+    if length is not None:
+        return length
+
     from freestyle.chainingiterators import pyChainSilhouetteGenericIterator
-    length = 0.0
+    start = perf_counter()
+    time_stamp = criterion[1] if criterion[0] == 'time_stamp' else None
+    # keys and lengths of the ViewEdges on the run
+    keys = []
+    lengths = []
     # setup iterator
     _it = pyChainSilhouetteGenericIterator(False, False)
     _it.begin = ve
@@ -90,34 +245,925 @@ def get_chain_length(ve, orientation):
     _it.orientation = orientation
     _it.init()
 
-    # run iterator till end of chain
-    while not (_it.is_end):
-        length += _it.object.length_2d
-        if (_it.is_begin):
-            # _it has looped back to the beginning;
-            # break to prevent infinite loop
+    # run iterator till the first visible ViewEdge
+    looped = False
+    while not _it.is_end:
+        edge = _it.object
+        if (edge.qi == 0) if time_stamp is None else (edge.time_stamp == time_stamp):
             break
+        keys.append((id_key(edge.id), _it.orientation, criterion))
+        lengths.append(edge.length_2d)
         _it.increment()
+        if _it.is_begin:
+            looped = True
+            break
 
-    # reset iterator
-    _it.begin = ve
-    _it.current_edge = ve
-    _it.orientation = orientation
-
-    # run iterator till begin of chain
-    if not _it.is_begin:
-        _it.decrement()
-        while not (_it.is_end or _it.is_begin):
-            length += _it.object.length_2d
-            _it.decrement()
+    if looped:
+        # the run is a closed loop, every ViewEdge on it sees all of it
+        cache.update(dict.fromkeys(keys, sum(lengths)))
+    else:
+        # the run ahead of every ViewEdge on it is a suffix of this one
+        length = 0.0
+        for edge_key, edge_length in zip(reversed(keys), reversed(lengths)):
+            length += edge_length
+            cache[edge_key] = length
 
-    return length
+    if _statistics is not None:
+        _statistics.gap_walks += 1
+        _statistics.gap_edges += len(keys)
+        _statistics.gap_length += sum(lengths)
+        _statistics.gap_time += perf_counter() - start
+    return cache.setdefault(key, 0.0)
 
 
 def find_matching_vertex(id, it):
     """Finds the matching vertex, or returns None """
     return next((ve for ve in it if ve.id == id), None)
 
+
+def find_matching_entry(id, edges):
+    """Finds the adjacency entry (see AdjacencyIndex) of the ViewEdge with the given id, or returns None """
+    key = id_key(id)
+    return next((entry for entry in edges if entry[3] == key), None)
+
+
+class AdjacencyIndex(FrameCache):
+    """
+    Maps the id of a ViewVertex to an immutable tuple holding a
+    (ViewEdge, nature, incoming, id) entry for every adjacent ViewEdge,
+    in the order in which an AdjacencyIterator visits them. 'id' is the
+    ViewEdge id as returned by id_key().
+
+    For chaining through TVertices, it also resolves the mate of a ViewEdge
+    (mate_of) and the ViewEdges that share an SVertex with a given one
+    (sharing_svertex) in constant time, once a TVertex has been indexed.
+    """
+    def __init__(self):
+        FrameCache.__init__(self)
+        # TVertex id -> (ViewEdge id -> entry of its mate,
+        #                SVertex id.first -> positions of the ViewEdges ending at that SVertex)
+        self._tvertices = {}
+        # ViewEdge id -> id.first of its first and last SVertex
+        self._svertex_ends = {}
+
+    def clear(self):
+        FrameCache.clear(self)
+        self._tvertices.clear()
+        self._svertex_ends.clear()
+
+    def check(self):
+        FrameCache.check(self)
+        if not self:
+            self.build()
+        return self
+
+    def build(self):
+        """Indexes the vertices of all ViewEdges in the current working set in one sweep """
+        edges_of = self.edges_of
+        for i in range(Operators.get_view_edges_size()):
+            ve = Operators.get_viewedge_from_index(i)
+            edges_of(ve.first_viewvertex)
+            edges_of(ve.last_viewvertex)
+
+    def edges_of(self, vertex):
+        """Returns the entries of all ViewEdges adjacent to the given ViewVertex """
+        key = id_key(vertex.id)
+        edges = dict.get(self, key)
+        if edges is None:
+            edges = self[key] = tuple((ve, ve.nature, incoming, id_key(ve.id))
+                                      for (ve, incoming) in vertex.edges_begin())
+        return edges
+
+    def adjacent_edges(self, vertex, restrict_to_selection=False, restrict_to_unvisited=False):
+        """
+        Returns the entries of the ViewEdges adjacent to the given ViewVertex,
+        restricted like an AdjacencyIterator with the same arguments would.
+        """
+        edges = self.edges_of(vertex)
+        if not (restrict_to_selection or restrict_to_unvisited):
+            return edges
+        time_stamp = ContextFunctions.get_time_stamp()
+        return tuple(entry for entry in edges if
+                     (not restrict_to_selection or entry[0].time_stamp == time_stamp) and
+                     (not restrict_to_unvisited or entry[0].chaining_time_stamp <= time_stamp))
+
+    def allows(self, entry, restrict_to_selection=False, restrict_to_unvisited=False):
+        """Returns True if an AdjacencyIterator with the same arguments would visit the given entry """
+        time_stamp = ContextFunctions.get_time_stamp()
+        return ((not restrict_to_selection or entry[0].time_stamp == time_stamp) and
+                (not restrict_to_unvisited or entry[0].chaining_time_stamp <= time_stamp))
+
+    def svertex_ends(self, ve, ve_id):
+        """Returns the id.first of the first and the last SVertex of a ViewEdge """
+        ends = self._svertex_ends.get(ve_id)
+        if ends is None:
+            ends = self._svertex_ends[ve_id] = (ve.first_fedge.first_svertex.id.first,
+                                                ve.last_fedge.second_svertex.id.first)
+        return ends
+
+    def index_tvertex(self, vertex):
+        """Returns the mate and SVertex tables of a TVertex (see __init__) """
+        key = id_key(vertex.id)
+        tables = self._tvertices.get(key)
+        if tables is None:
+            edges = self.edges_of(vertex)
+            mates = {}
+            svertices = {}
+            for position, (ve, nature, incoming, ve_id) in enumerate(edges):
+                mate = vertex.get_mate(ve)
+                if mate is not None:
+                    mates[ve_id] = find_matching_entry(mate.id, edges)
+                for first in set(self.svertex_ends(ve, ve_id)):
+                    svertices.setdefault(first, []).append(position)
+            tables = self._tvertices[key] = (mates, svertices)
+        return tables
+
+    def mate_of(self, vertex, ve, restrict_to_selection=False, restrict_to_unvisited=False):
+        """
+        Returns the entry of the mate of a ViewEdge at a TVertex, or None if there is
+        none or an AdjacencyIterator with the same arguments would not visit it.
+        """
+        mates = self.index_tvertex(vertex)[0]
+        entry = mates.get(id_key(ve.id))
+        if entry is None or not self.allows(entry, restrict_to_selection, restrict_to_unvisited):
+            return None
+        return entry
+
+    def sharing_svertex(self, vertex, ve, restrict_to_selection=False, restrict_to_unvisited=False):
+        """
+        Returns the first entry at a TVertex (in adjacency order) whose first or last
+        SVertex has the same id.first as the first or last SVertex of a ViewEdge, or None.
+        """
+        svertices = self.index_tvertex(vertex)[1]
+        edges = self.edges_of(vertex)
+        first, last = self.svertex_ends(ve, id_key(ve.id))
+        for position in sorted(set(svertices.get(first, ())).union(svertices.get(last, ()))):
+            if self.allows(edges[position], restrict_to_selection, restrict_to_unvisited):
+                return edges[position]
+        return None
+
+
+_adjacency = AdjacencyIndex()
+
+
+def get_adjacency_index():
+    """Returns the AdjacencyIndex of the view map that is currently processed """
+    return _adjacency.check()
+
+
+# -- chaining statistics -- #
+
+class IteratorStatistics:
+    """Counters and timings (in seconds) of the traverse() calls of one ChainingIterator class """
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.adjacency = 0
+        self.tvertex_calls = 0
+        self.tvertex_time = 0.0
+        self.ambiguous = 0
+        self.ends = 0
+
+    def report(self, name):
+        calls = max(self.calls, 1)
+        nontvertex_calls = self.calls - self.tvertex_calls
+        return ("  {}: {} traverse calls in {:.3f} ms ({:.2f} us each), {:.2f} adjacent edges on average\n"
+                "    TVertex: {} calls in {:.3f} ms, NonTVertex: {} calls in {:.3f} ms\n"
+                "    chain ends: {}, of which ambiguous winners: {}").format(
+                name, self.calls, self.time * 1e3, self.time / calls * 1e6, self.adjacency / calls,
+                self.tvertex_calls, self.tvertex_time * 1e3,
+                nontvertex_calls, (self.time - self.tvertex_time) * 1e3,
+                self.ends, self.ambiguous)
+
+
+class ChainingStatistics:
+    """
+    Statistics of the Python chaining iterators, collected between
+    enable_chaining_statistics() and disable_chaining_statistics()
+    """
+    def __init__(self):
+        # ChainingIterator class name -> IteratorStatistics
+        self.iterators = {}
+        self.gap_walks = 0
+        self.gap_edges = 0
+        self.gap_length = 0.0
+        self.gap_time = 0.0
+        # statistics of the traverse() call in progress, if any
+        self.current = None
+
+    def report(self, title):
+        lines = ["chaining statistics for " + title]
+        for name, statistics in sorted(self.iterators.items()):
+            lines.append(statistics.report(name))
+        lines.append("  gap walks: {} over {} edges, {:.1f} pixels in total, in {:.3f} ms".format(
+                     self.gap_walks, self.gap_edges, self.gap_length, self.gap_time * 1e3))
+        return "\n".join(lines)
+
+
+_statistics = None
+# ChainingIterator subclass -> its own traverse(), while instrumented
+_instrumented = {}
+
+
+def instrumented_traverse(traverse):
+    """Wraps a traverse() method so that it updates the chaining statistics """
+    @wraps(traverse)
+    def wrapper(self, iter):
+        statistics = _statistics
+        # count calls from subclasses (e.g. super().traverse()) only once
+        if statistics is None or statistics.current is not None:
+            return traverse(self, iter)
+        name = type(self).__name__
+        current = statistics.iterators.get(name)
+        if current is None:
+            current = statistics.iterators[name] = IteratorStatistics()
+        vertex = self.next_vertex
+        current.adjacency += len(get_adjacency_index().edges_of(vertex))
+        statistics.current = current
+        start = perf_counter()
+        try:
+            winner = traverse(self, iter)
+        finally:
+            elapsed = perf_counter() - start
+            statistics.current = None
+        current.calls += 1
+        current.time += elapsed
+        if type(vertex) is TVertex:
+            current.tvertex_calls += 1
+            current.tvertex_time += elapsed
+        if winner is None:
+            current.ends += 1
+        return winner
+    return wrapper
+
+
+def python_chaining_iterators(cls=ChainingIterator):
+    """Yields the subclasses of cls that implement traverse() in Python """
+    for subclass in cls.__subclasses__():
+        if isinstance(subclass.__dict__.get('traverse'), FunctionType):
+            yield subclass
+        yield from python_chaining_iterators(subclass)
+
+
+def enable_chaining_statistics():
+    """
+    Starts collecting statistics of the Python chaining iterators, and
+    returns the (new) ChainingStatistics. Only the chaining iterators
+    that are defined at this point are instrumented; when disabled,
+    chaining runs without any overhead.
+    """
+    global _statistics
+    if _statistics is None:
+        for cls in python_chaining_iterators():
+            traverse = cls.__dict__['traverse']
+            _instrumented[cls] = traverse
+            cls.traverse = instrumented_traverse(traverse)
+    _statistics = ChainingStatistics()
+    return _statistics
+
+
+def disable_chaining_statistics():
+    """Stops collecting statistics, and returns the ChainingStatistics collected so far (or None) """
+    global _statistics
+    for cls, traverse in _instrumented.items():
+        cls.traverse = traverse
+    _instrumented.clear()
+    statistics, _statistics = _statistics, None
+    return statistics
+
+
+def count_ambiguous_winner():
+    """Records that a traverse() call found more than one candidate, if statistics are enabled """
+    if _statistics is not None and _statistics.current is not None:
+        _statistics.current.ambiguous += 1
+
+
+# -- view map density snapshots -- #
+
+class ViewMapSnapshot:
+    """
+    A copy of one level of the complete view map (orientation None) or of
+    a directional view map (orientation 0-3), stored in a flat array at
+    the resolution of that level.  Rows are copied from the view map the
+    first time they are needed, so sparse sampling stays cheap.
+    """
+    def __init__(self, level, orientation=None):
+        self.level = level
+        self.orientation = orientation
+        # size of the view map (level 0)
+        self.width = ContextFunctions.get_canvas_width()
+        self.height = ContextFunctions.get_canvas_height()
+        # size of this level
+        self.level_width = max(self.width >> level, 1)
+        self.level_height = max(self.height >> level, 1)
+        self.data = array('f', [0.0]) * (self.level_width * self.level_height)
+        self._copied = bytearray(self.level_height)
+
+    def copy_row(self, sy):
+        """Copies row sy (counted from the bottom) of this level from the view map """
+        level = self.level
+        # reading at multiples of 2**level returns the pixels of the level itself
+        y = self.height - 1 - (sy << level)
+        if self.orientation is None:
+            values = (ContextFunctions.read_complete_view_map_pixel(level, sx << level, y)
+                      for sx in range(self.level_width))
+        else:
+            orientation = self.orientation
+            values = (ContextFunctions.read_directional_view_map_pixel(orientation, level, sx << level, y)
+                      for sx in range(self.level_width))
+        start = sy * self.level_width
+        self.data[start:start + self.level_width] = array('f', values)
+        self._copied[sy] = 1
+
+    def level_pixel(self, sx, sy):
+        """Returns pixel (sx, sy) of this level, rows counted from the bottom """
+        if not self._copied[sy]:
+            self.copy_row(sy)
+        return self.data[sy * self.level_width + sx]
+
+    def pixel(self, x, y):
+        """
+        Returns the same value as reading the view map at pixel (x, y)
+        through ContextFunctions, including the interpolation between the
+        pixels of the level that the view map's image pyramid performs.
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0.0
+        y = self.height - 1 - y
+        level = self.level
+        px = self.level_pixel
+        if level == 0:
+            return px(x, y)
+        i = 1 << level
+        w = self.level_width
+        h = self.level_height
+        sx = min(x >> level, w - 1)
+        sy = min(y >> level, h - 1)
+        A = i * (sx + 1) - x
+        B = x - i * sx
+        C = i * (sy + 1) - y
+        D = y - i * sy
+        P1 = A * px(sx, sy)
+        if sx < w - 1:
+            if x % i != 0:
+                P1 += B * px(sx + 1, sy)
+        else:
+            P1 += B * px(sx, sy)
+        P2 = 0.0
+        if sy < h - 1:
+            if y % i != 0:
+                P2 = A * px(sx, sy + 1)
+                if sx < w - 1:
+                    if x % i != 0:
+                        P2 += B * px(sx + 1, sy + 1)
+                else:
+                    P2 += B * px(sx, sy + 1)
+        else:
+            P2 = P1
+        return (C * P1 + D * P2) / (1 << (2 * level))
+
+    def bilinear(self, x, y):
+        """
+        Returns the view map at the (float) position (x, y), interpolated
+        bilinearly between the pixels of the level
+        """
+        if not (0.0 <= x < self.width and 0.0 <= y < self.height):
+            return 0.0
+        scale = 1.0 / (1 << self.level)
+        u = x * scale
+        v = (self.height - 1 - y) * scale
+        w = self.level_width
+        h = self.level_height
+        sx = min(int(u), w - 1)
+        sy = min(int(v), h - 1)
+        fx = bound(0.0, u - sx, 1.0)
+        fy = bound(0.0, v - sy, 1.0)
+        sx1 = min(sx + 1, w - 1)
+        sy1 = min(sy + 1, h - 1)
+        px = self.level_pixel
+        bottom = (1.0 - fx) * px(sx, sy) + fx * px(sx1, sy)
+        top = (1.0 - fx) * px(sx, sy1) + fx * px(sx1, sy1)
+        return (1.0 - fy) * bottom + fy * top
+
+    def sample(self, x, y, bilinear=False):
+        """Returns the view map at (x, y); truncated to a pixel like the C functions unless bilinear is True """
+        return self.bilinear(x, y) if bilinear else self.pixel(int(x), int(y))
+
+
+_view_map_snapshots = FrameCache()
+
+
+def get_view_map_snapshots(level, orientations=(None,)):
+    """
+    Returns a ViewMapSnapshot per orientation (None for the complete
+    view map, 0-3 for the directional view maps) of the given level.
+    The snapshots are kept for the duration of a frame.
+    """
+    cache = _view_map_snapshots.current()
+    snapshots = []
+    for orientation in orientations:
+        key = (level, orientation)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = cache[key] = ViewMapSnapshot(level, orientation)
+        snapshots.append(snapshot)
+    return snapshots
+
+
+# -- occlusion queries -- #
+
+_occlusion_ids = FrameCache()
+
+
+def query_ids(functor, inter):
+    """
+    Returns the ids (see id_key) of the ViewShapes that a functor like
+    GetShapeF1D returns for an Interface1D, as a tuple.  The result is
+    cached for the duration of a frame if the Interface1D is a ViewEdge;
+    chains and strokes are queried every time, because their ids do not
+    identify their geometry (a split chain keeps the id of its parent).
+    """
+    if type(inter) is not ViewEdge:
+        return tuple(id_key(shape.id) for shape in pooled_functor(functor)(inter))
+    cache = _occlusion_ids.current()
+    key = (functor, id_key(inter.id))
+    ids = cache.get(key)
+    if ids is None:
+        ids = cache[key] = tuple(id_key(shape.id) for shape in pooled_functor(functor)(inter))
+    return ids
+
+
+def get_shape_ids(inter):
+    """Returns the ids of the shapes an Interface1D belongs to (see query_ids) """
+    return query_ids(GetShapeF1D, inter)
+
+
+def get_occluder_ids(inter):
+    """Returns the ids of the shapes occluding an Interface1D (see query_ids) """
+    return query_ids(GetOccludersF1D, inter)
+
+
+def get_occludee_ids(inter):
+    """Returns the ids of the shapes occluded by an Interface1D (see query_ids) """
+    return query_ids(GetOccludeeF1D, inter)
+
+
+def get_occlusion_ids(inter):
+    """
+    Returns the ids of the occluders and of the shapes of an Interface1D,
+    as two frozensets.  Both are cached for the duration of a frame if the
+    Interface1D is a ViewEdge (see query_ids).
+    """
+    if type(inter) is not ViewEdge:
+        return (frozenset(get_occluder_ids(inter)), frozenset(get_shape_ids(inter)))
+    cache = _occlusion_ids.current()
+    key = (frozenset, id_key(inter.id))
+    ids = cache.get(key)
+    if ids is None:
+        ids = cache[key] = (frozenset(get_occluder_ids(inter)), frozenset(get_shape_ids(inter)))
+    return ids
+
+
+# -- turn counting -- #
+
+def turn_angle(ax, ay, bx, by, cx, cy):
+    """
+    Returns the angle between the normals of the segments AB and BC, as
+    Curvature2DAngleF0D computes it at B.
+    """
+    n1x, n1y = ay - by, bx - ax
+    n2x, n2y = by - cy, cx - bx
+    l1 = sqrt(n1x * n1x + n1y * n1y)
+    l2 = sqrt(n2x * n2x + n2y * n2y)
+    if l1 == 0 and l2 == 0:
+        # Curvature2DAngleF0D fails for two zero-length segments as well
+        raise RuntimeError("Curvature2DAngleF0D __call__ method failed")
+    if l1 != 0:
+        n1x, n1y = n1x / l1, n1y / l1
+    if l2 != 0:
+        n2x, n2y = n2x / l2, n2y / l2
+    return acos(bound(-1.0, n1x * n2x + n1y * n2y, 1.0))
+
+
+def iter_curvature_angles(points):
+    """
+    Yields the 2D curvature angle at each of the given (x, y) points, with
+    the same values as Curvature2DAngleF0D: the end points take the angle
+    of their neighbour, and curves of less than three points have none.
+    """
+    points = iter(points)
+    window = tuple(islice(points, 3))
+    if len(window) < 3:
+        yield from (0.0 for _ in window)
+        return
+    (ax, ay), (bx, by), (cx, cy) = window
+    angle = turn_angle(ax, ay, bx, by, cx, cy)
+    yield angle
+    yield angle
+    for px, py in points:
+        ax, ay, bx, by, cx, cy = bx, by, cx, cy, px, py
+        angle = turn_angle(ax, ay, bx, by, cx, cy)
+        yield angle
+    yield angle
+
+
+def projected_points(inter):
+    """Returns the projected (x, y) points of an Interface1D as a tuple """
+    return tuple((v.projected_x, v.projected_y) for v in Interface0DIterator(inter))
+
+
+class ChainAngles:
+    """
+    The projected points of a chain and the 2D curvature angles at its
+    inner points.  The chains that splitting makes of it are runs of its
+    points with at most one new point at either end, so their angles
+    can be sliced out of these (see slice()).
+    """
+    def __init__(self, points):
+        self.points = points
+        # the first and the last index of every point
+        self.first = {}
+        self.last = {}
+        for i, point in enumerate(points):
+            self.first.setdefault(point, i)
+            self.last[point] = i
+        inner = (turn_angle(ax, ay, bx, by, cx, cy)
+                 for (ax, ay), (bx, by), (cx, cy) in zip(points, points[1:], points[2:]))
+        # the angle at every point, 0.0 at either end
+        self.angles = (0.0,) + tuple(inner) + (0.0,)
+
+    def slice(self, head, tail, n):
+        """
+        Returns the curvature angles (see iter_curvature_angles) of a chain
+        of n > 2 points, given its first two points (head) and its last two
+        points in reverse order (tail), or None if that chain is not a
+        piece of this one.
+        """
+        start = self.first.get(head[0])
+        new_head = start is None
+        if new_head:
+            start = self.first.get(head[1])
+        stop = self.last.get(tail[0])
+        new_tail = stop is None
+        if new_tail:
+            stop = self.last.get(tail[1])
+        if start is None or stop is None or stop - start + 1 + new_head + new_tail != n:
+            return None
+        # the angles at the points of the piece that have the same neighbours
+        # as in this chain; only the points next to a new point differ
+        offset = start - new_head
+        angles = list(self.angles[offset + 1:offset + n - 1])
+        if new_head or new_tail:
+            points = (head[:1] if new_head else ()) + self.points[start:stop + 1] + (tail[:1] if new_tail else ())
+            if new_head:
+                angles[0] = turn_angle(*(points[0] + points[1] + points[2]))
+            if new_tail:
+                angles[-1] = turn_angle(*(points[-3] + points[-2] + points[-1]))
+        # the end points take the angle of their neighbour
+        return [angles[0]] + angles + [angles[-1]]
+
+
+_chain_angles = FrameCache()
+
+
+def chain_turn_angles(chain):
+    """
+    Returns the 2D curvature angles at the points of a Chain, like
+    iter_curvature_angles.  The points and angles of every chain are kept
+    for the duration of a frame, under the id that splitting passes on to
+    the pieces of the chain; the angles of a piece are sliced out of them
+    after reading only its two first and two last points.
+    """
+    n = chain.segments_size + 1
+    if n < 3:
+        return [0.0] * n
+    head = tuple((v.projected_x, v.projected_y) for v in islice(Interface0DIterator(chain), 2))
+    it = chain.vertices_end()
+    it.decrement()
+    last = it.object
+    it.decrement()
+    before_last = it.object
+    tail = ((last.projected_x, last.projected_y), (before_last.projected_x, before_last.projected_y))
+    pieces = _chain_angles.current().setdefault(id_key(chain.id), [])
+    for piece in pieces:
+        angles = piece.slice(head, tail, n)
+        if angles is not None:
+            return angles
+    piece = ChainAngles(projected_points(chain))
+    pieces.append(piece)
+    return piece.slice(head, tail, n)
+
+
+def count_turns(inter, angle, limit=None):
+    """
+    Counts the vertices of an Interface1D whose 2D curvature angle is
+    larger than angle.  Counting stops as soon as the count exceeds limit.
+    The angles of chains are cached (see chain_turn_angles), so that
+    recursive splitting does not evaluate them again for every piece.
+    """
+    if type(inter) is Chain:
+        turns = chain_turn_angles(inter)
+    else:
+        turns = iter_curvature_angles(projected_points(inter))
+    count = 0
+    for turn in turns:
+        if turn > angle:
+            count += 1
+            if limit is not None and count > limit:
+                break
+    return count
+
+
+# -- sorting -- #
+
+def interface1d_id(inter):
+    """Returns the id of an Interface1D (see id_key) """
+    return id_key(inter.id)
+
+
+def split_chain_id(chain):
+    """
+    Returns a key that tells apart the pieces of a split chain, which all
+    keep the id of the chain: the id, the first point and the 2D length.
+    """
+    first = chain.vertices_begin().object
+    return (id_key(chain.id), first.projected_x, first.projected_y, chain.length_2d)
+
+
+def sort_by_key(func, reverse=False):
+    """
+    Sorts the chains in the current working set by increasing key, or
+    by decreasing key if reverse is True, where func(chain) returns the
+    key of a chain (e.g. GetZF1D).  Unlike Operators.sort with a
+    comparator that evaluates func, every key is evaluated only once.
+    """
+    # predicates imports this module
+    from freestyle.predicates import pyKeyBP1D
+    n = Operators.get_chains_size()
+    chains = tuple(Operators.get_chain_from_index(i) for i in range(n))
+    # the chains have to be told apart before any key is evaluated;
+    # split chains keep the id of the chain they were split from
+    for identify in (interface1d_id, split_chain_id):
+        ids = tuple(map(identify, chains))
+        if len(frozenset(ids)) == n:
+            Operators.sort(pyKeyBP1D(func, reverse, dict(zip(ids, map(func, chains))), identify))
+            return
+    # the chains cannot be told apart, so keys have to be evaluated per comparison
+    Operators.sort(pyKeyBP1D(func, reverse))
+
+
+# -- batched selection -- #
+
+class ViewEdgeColumns:
+    """
+    A column snapshot of the ViewEdges in the current working set, for
+    predicates that implement evaluate_many(columns).  Every column has
+    one entry per ViewEdge, in working set order, and is only read from
+    the ViewEdges when it is first used.
+    """
+    def __init__(self):
+        self.size = Operators.get_view_edges_size()
+        self._columns = {}
+
+    def _column(self, name, getter, typecode=None):
+        column = self._columns.get(name)
+        if column is None:
+            values = map(getter, self.edges)
+            column = array(typecode, values) if typecode else tuple(values)
+            self._columns[name] = column
+        return column
+
+    @property
+    def edges(self):
+        edges = self._columns.get("edges")
+        if edges is None:
+            edges = tuple(Operators.get_viewedge_from_index(i) for i in range(self.size))
+            self._columns["edges"] = edges
+        return edges
+
+    @property
+    def ids(self):
+        return self._column("ids", lambda ve: id_key(ve.id))
+
+    @property
+    def nature(self):
+        return self._column("nature", attrgetter("nature"), 'l')
+
+    @property
+    def qi(self):
+        return self._column("qi", attrgetter("qi"), 'l')
+
+    @property
+    def length_2d(self):
+        return self._column("length_2d", attrgetter("length_2d"), 'd')
+
+    @property
+    def shape_id(self):
+        return self._column("shape_id", lambda ve: id_key(ve.viewshape.id))
+
+    @property
+    def shape_name(self):
+        return self._column("shape_name", lambda ve: ve.viewshape.name)
+
+    @property
+    def time_stamp(self):
+        return self._column("time_stamp", attrgetter("time_stamp"), 'L')
+
+
+def supports_many(pred):
+    """
+    Returns True if pred and every predicate it combines implement
+    evaluate_many(columns), without reading any column
+    """
+    if not hasattr(pred, "evaluate_many"):
+        return False
+    supports = getattr(pred, "supports_many", None)
+    return supports is None or supports()
+
+
+# -- batched integration -- #
+
+def sample_points_2d(inter, sampling, integration_type=IntegrationType.MEAN):
+    """
+    Returns the x and y coordinates (two arrays) of the points of an
+    Interface1D at which integrate() evaluates a UnaryFunction0D for the
+    given sampling and integration type
+    """
+    if integration_type == IntegrationType.FIRST:
+        points = (next(inter.points_begin(sampling)).point_2d,)
+    elif integration_type == IntegrationType.LAST:
+        it = inter.points_end(sampling)
+        it.decrement()
+        points = (it.object.point_2d,)
+    else:
+        points = tuple(point.point_2d for point in inter.points_begin(sampling))
+    return array('d', (p.x for p in points)), array('d', (p.y for p in points))
+
+
+def integrate_values(values, integration_type=IntegrationType.MEAN):
+    """
+    Integrates values (one per sample point, see sample_points_2d) the
+    same way integrate() integrates the results of a UnaryFunction0D
+    """
+    if not values:
+        return 0.0
+    if integration_type == IntegrationType.MIN:
+        result = values[0]
+        for value in values[1:]:
+            if value < result:
+                result = value
+    elif integration_type == IntegrationType.MAX:
+        result = values[0]
+        for value in values[1:]:
+            if value > result:
+                result = value
+    elif integration_type == IntegrationType.FIRST:
+        result = values[0]
+    elif integration_type == IntegrationType.LAST:
+        result = values[-1]
+    else:
+        result = 0.0
+        for value in values:
+            result += value
+        result /= len(values)
+    return float(result)
+
+
+# -- blueprint shapes -- #
+
+@lru_cache(maxsize=32)
+def phase_table(length):
+    """
+    Returns the phases, cosines and sines (three arrays) of length points
+    spread evenly over a full turn, like phase_to_direction
+    """
+    phases = array('d', (i / (length - 1) for i in range(length)))
+    cosines = array('d', (cos(2 * pi * phase) for phase in phases))
+    sines = array('d', (sin(2 * pi * phase) for phase in phases))
+    return phases, cosines, sines
+
+
+def ellipse_points(length, centers, radii):
+    """
+    Returns the x and y coordinates (two arrays) of turns of length points
+    around an ellipse.  Turn j moves from centers[j] and radii[j] to
+    centers[j + 1] and radii[j + 1], all (x, y) tuples.
+    """
+    phases, cosines, sines = phase_table(length)
+    xs = array('d')
+    ys = array('d')
+    for (cx0, cy0), (cx1, cy1), (rx0, ry0), (rx1, ry1) in zip(centers, centers[1:], radii, radii[1:]):
+        dcx, dcy, drx, dry = cx1 - cx0, cy1 - cy0, rx1 - rx0, ry1 - ry0
+        xs.extend(cx0 + dcx * p + (rx0 + drx * p) * c for p, c in zip(phases, cosines))
+        ys.extend(cy0 + dcy * p + (ry0 + dry * p) * s for p, s in zip(phases, sines))
+    return xs, ys
+
+
+def polygon_points(corners, sides, bounds):
+    """
+    Returns the x and y coordinates (two arrays) and the visibility (a
+    list) of points along the sides of a polygon.  Side k starts at
+    corners[k] and runs along the vector sides[k]; it consists of the
+    points bounds[k] up to (but excluding) bounds[k + 1], of which the
+    last one is invisible.
+    """
+    xs = array('d')
+    ys = array('d')
+    visible = []
+    for (x, y), (dx, dy), start, end in zip(corners, sides, bounds, bounds[1:]):
+        last = end - start - 1
+        xs.extend(x + dx * i / last for i in range(end - start))
+        ys.extend(y + dy * i / last for i in range(end - start))
+        visible += [True] * last
+        visible.append(False)
+    return xs, ys, visible
+
+
+def set_points(stroke, xs, ys, visible=None):
+    """
+    Assigns the given coordinates (and visibility) to the vertices of the
+    stroke in a single pass.  Returns the number of vertices assigned.
+    """
+    n = 0
+    if visible is None:
+        for svert, x, y in zip(stroke, xs, ys):
+            svert.point = (x, y)
+            n += 1
+    else:
+        for svert, x, y, v in zip(stroke, xs, ys, visible):
+            svert.point = (x, y)
+            svert.attribute.visible = v
+            n += 1
+    return n
+
+
+# -- stroke caps -- #
+
+@lru_cache(maxsize=64)
+def round_cap_profile(nverts):
+    """
+    Returns the thickness factors of the nverts vertices of a round cap,
+    from the tip inward (see RoundCapShader)
+    """
+    n = 1.0 / nverts
+    return tuple(sqrt(1.0 - min((t + 1) * n, 1.0) ** 2) for t in range(nverts, 0, -1))
+
+
+def add_caps(stroke, beg, end):
+    """
+    Adds cap vertices before the first and after the last vertex of the
+    stroke.  beg and end are (points, factors) pairs ordered from the tip
+    inward; the cap vertices take the attribute of the first (last) vertex,
+    with the thickness scaled by the factors.  Stroke.insert_vertex()
+    updates the length of the whole stroke, so the stroke is resampled
+    once instead and every vertex is written once.
+    """
+    # resampling inserts vertices between the original ones, so their
+    # points and attributes are saved and written back in order
+    buffer = tuple((Vector(svert.point), StrokeAttribute(svert.attribute)) for svert in stroke)
+    (points_beg, factors_beg), (points_end, factors_end) = beg, end
+    stroke.resample(len(buffer) + len(points_beg) + len(points_end))
+    attribute_beg = buffer[0][1]
+    attribute_end = buffer[-1][1]
+    vertices = chain(
+        ((point, attribute_beg, factor) for point, factor in zip(points_beg, factors_beg)),
+        ((point, attribute, None) for point, attribute in buffer),
+        ((point, attribute_end, factor) for point, factor in zip(reversed(points_end), reversed(factors_end))),
+        )
+    for svert, (point, attribute, factor) in zip(stroke, vertices):
+        svert.point = point
+        svert.attribute = attribute
+        if factor is not None:
+            R, L = attribute.thickness
+            svert.attribute.thickness = (R * factor, L * factor)
+
+
+# -- diffusion -- #
+
+def diffuse_points(xs, ys, normals, factor, iterations, tolerance=None):
+    """
+    Moves every point along its normal by factor times the 2D curvature
+    angle at the point (see iter_curvature_angles), iterations times.
+    The offsets of an iteration are all computed from the points of the
+    previous one (Jacobi-style).  With a tolerance, iterating stops as
+    soon as no point moves further than that.  The normals are given once:
+    Normal2DF0D computes them from the underlying FEdges (see
+    stroke_normal), which moving the points does not change.  Returns the
+    new x and y coordinates (two arrays).
+    """
+    xs = array('d', xs)
+    ys = array('d', ys)
+    nxs = array('d', (n[0] for n in normals))
+    nys = array('d', (n[1] for n in normals))
+    for _ in range(iterations):
+        offsets = array('d', (factor * a for a in iter_curvature_angles(zip(xs, ys))))
+        xs = array('d', map(lambda x, nx, d: x + nx * d, xs, nxs, offsets))
+        ys = array('d', map(lambda y, ny, d: y + ny * d, ys, nys, offsets))
+        if tolerance is not None and max(map(abs, offsets), default=0.0) <= tolerance:
+            break
+    return xs, ys
+
+
 # -- helper functions for iterating -- #
 
 
@@ -43,6 +43,7 @@ from freestyle.chainingiterators import (
     )
 from freestyle.functions import (
     Curvature2DAngleF0D,
+    GetZF1D,
     Normal2DF0D,
     QuantitativeInvisibilityF1D,
     VertexOrientation2DF0D,
@@ -54,16 +55,15 @@ from freestyle.predicates import (
     ExternalContourUP1D,
     FalseBP1D,
     FalseUP1D,
-    Length2DBP1D,
-    NotBP1D,
     NotUP1D,
     OrUP1D,
     QuantitativeInvisibilityUP1D,
     TrueBP1D,
     TrueUP1D,
     WithinImageBoundaryUP1D,
+    compile_predicate,
     pyNatureUP1D,
-    pyZBP1D,
+    select_many,
     )
 from freestyle.shaders import (
     BackboneStretcherShader,
@@ -95,6 +95,12 @@ from freestyle.utils import (
     iter_distance_from_camera,
     iter_distance_from_object,
     iter_material_value,
+    register_frame_cache_handler,
+    reset_frame_caches,
+    sort_by_key,
+    debug_enabled,
+    enable_chaining_statistics,
+    disable_chaining_statistics,
     )
 from _freestyle import (
     blendRamp,
@@ -107,6 +113,7 @@ import time
 from mathutils import Vector
 from math import pi, sin, cos, acos, radians
 from itertools import cycle, tee
+from operator import attrgetter
 from functools import namedtuple
 
 # named tuple primitives used for storing data.
@@ -659,6 +666,9 @@ class QuantitativeInvisibilityRangeUP1D(UnaryPredicate1D):
         qi = self.getQI(inter)
         return self.qi_start <= qi <= self.qi_end
 
+    def evaluate_many(self, columns):
+        return [self.qi_start <= qi <= self.qi_end for qi in columns.qi]
+
 
 class ObjectNamesUP1D(UnaryPredicate1D):
     def __init__(self, names, negative):
@@ -672,6 +682,9 @@ class ObjectNamesUP1D(UnaryPredicate1D):
             return not found
         return found
 
+    def evaluate_many(self, columns):
+        return [(name in self._names) != self._negative for name in columns.shape_name]
+
 
 # -- Split by dashed line pattern -- #
 
@@ -908,6 +921,9 @@ class Seed:
 
 _seed = Seed()
 
+# name of the render layer processed last; every render layer has its own view map
+_layer_name = None
+
 
 integration_types = {
     'MEAN': IntegrationType.MEAN,
@@ -920,6 +936,15 @@ integration_types = {
 # main function for parameter processing
 
 def process(layer_name, lineset_name):
+    global _layer_name
+    register_frame_cache_handler()
+    if layer_name != _layer_name:
+        reset_frame_caches()
+        _layer_name = layer_name
+    # in debug mode, report the cost of chaining for every line set
+    if debug_enabled():
+        enable_chaining_statistics()
+
     scene = getCurrentScene()
     layer = scene.render.layers[layer_name]
     lineset = layer.freestyle_settings.linesets[lineset_name]
@@ -996,24 +1021,26 @@ def process(layer_name, lineset_name):
         upred = WithinImageBoundaryUP1D(*ContextFunctions.get_border())
         selection_criteria.append(upred)
     # select feature edges
-    upred = AndUP1D(*selection_criteria)
-    if upred is None:
+    if selection_criteria:
+        upred = compile_predicate(AndUP1D(*selection_criteria))
+    else:
         upred = TrueUP1D()
-    Operators.select(upred)
+    select_many(upred)
+    stop = compile_predicate(NotUP1D(upred))
     # join feature edges to form chains
     if linestyle.use_chaining:
         if linestyle.chaining == 'PLAIN':
             if linestyle.use_same_object:
-                Operators.bidirectional_chain(ChainSilhouetteIterator(), NotUP1D(upred))
+                Operators.bidirectional_chain(ChainSilhouetteIterator(), stop)
             else:
-                Operators.bidirectional_chain(ChainPredicateIterator(upred, TrueBP1D()), NotUP1D(upred))
+                Operators.bidirectional_chain(ChainPredicateIterator(upred, TrueBP1D()), stop)
         elif linestyle.chaining == 'SKETCHY':
             if linestyle.use_same_object:
                 Operators.bidirectional_chain(pySketchyChainSilhouetteIterator(linestyle.rounds))
             else:
                 Operators.bidirectional_chain(pySketchyChainingIterator(linestyle.rounds))
     else:
-        Operators.chain(ChainPredicateIterator(FalseUP1D(), FalseBP1D()), NotUP1D(upred))
+        Operators.chain(ChainPredicateIterator(FalseUP1D(), FalseBP1D()), stop)
     # split chains
     if linestyle.material_boundary:
         Operators.sequential_split(MaterialBoundaryUP0D())
@@ -1049,12 +1076,11 @@ def process(layer_name, lineset_name):
     if linestyle.use_sorting:
         integration = integration_types.get(linestyle.integration_type, IntegrationType.MEAN)
         if linestyle.sort_key == 'DISTANCE_FROM_CAMERA':
-            bpred = pyZBP1D(integration)
+            key = GetZF1D(integration)
         elif linestyle.sort_key == '2D_LENGTH':
-            bpred = Length2DBP1D()
-        if linestyle.sort_order == 'REVERSE':
-            bpred = NotBP1D(bpred)
-        Operators.sort(bpred)
+            key = attrgetter("length_2d")
+        # by default, the farthest and the longest chains come first
+        sort_by_key(key, reverse=(linestyle.sort_order != 'REVERSE'))
     # prepare a list of stroke shaders
     shaders_list = []
     for m in linestyle.geometry_modifiers:
@@ -1210,3 +1236,7 @@ def process(layer_name, lineset_name):
             shaders_list.append(DashedLineShader(pattern))
     # create strokes using the shaders list
     Operators.create(TrueUP1D(), shaders_list)
+
+    statistics = disable_chaining_statistics()
+    if statistics is not None:
+        print(statistics.report("line set '{}' of render layer '{}'".format(lineset_name, layer_name)))